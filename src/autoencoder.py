@@ -5,35 +5,105 @@ PARAMETERS
 
     random_seed = 109
         This module sets a random seed for numpy.random.seed() and
-        tensorflow.random.set_seed() to help ensure reproducible results
+        tensorflow.random.set_seed() to help ensure reproducible results,
+        tensorflow is imported (and seeded) on first use rather than when
+        this module is imported
+
+    sweep_params = ['encoding_dim', 'droprate', 'learning_rate', 'batch_size']
+        The build_dense_ae_architecture() and training arguments swept by
+        sweep_dense_ae(), in the order used to name each trial
 
 FUNCTIONS
 
     build_dense_ae_architecture()
         Builds and compiles a tensorflow.keras dense autoencoder network
 
+    taper_hidden_dims()
+        Returns encoder hidden layer widths tapering geometrically from a
+        maximum width towards the bottleneck dimension
+
+    count_dense_ae_size()
+        Counts the trainable parameters and per-observation forward pass
+        FLOPs of a dense autoencoder
+
+    build_dense_ae()
+        Builds and compiles a dense autoencoder with explicit hidden layer
+        widths, or widths fit to a parameter or FLOP budget, optionally with
+        tied encoder and decoder weights
+
+    export_encoder()
+        Exports the encoder Dense weights of a fitted autoencoder to a .npz
+        file for tensorflow-free encoding with inference.DenseNetwork
+
+    fit_dense_ae()
+        Trains an autoencoder with periodic, resumable checkpoints and early
+        stopping that restores the weights with the lowest val_loss
+
+    export_dense_ae()
+        Atomically saves the encoder and decoder of a fitted autoencoder
+
+    make_ae_dataset()
+        Builds a tf.data pipeline that streams (optionally memory-mapped)
+        embeddings in shuffled, prefetched (x, x) batches for autoencoder
+        training
+
+    sweep_dense_ae()
+        Trains a grid of build_dense_ae_architecture() variants in parallel
+        worker processes with pinned thread budgets, stopping poor trials
+        early by val_loss with successive halving
+
+    fit_parametric_umap()
+        Trains a dense network that regresses a fitted UMAP mapper's
+        embedding from its training data, for fast inference on new data
+
     plot_history()
         Plot training and validation loss using keras history object
 
 """
 
+import os
+import json
+import shutil
+import itertools
+import multiprocessing
+from math import ceil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .lazy import lazy_import
+from .inference import export_dense_npz, DenseNetwork
+
 # import and set seeds for reproducible results
 random_seed = 109
 
 from numpy.random import seed
 seed(random_seed)
 
-import tensorflow as tf
-tf.random.set_seed(random_seed)
+
+_tf_seeded = []
+
+
+def _seed_tensorflow(module):
+    """Sets the tensorflow random seed the first time tensorflow is used
+    """
+    if not _tf_seeded:
+        import tensorflow
+        tensorflow.random.set_seed(random_seed)
+        _tf_seeded.append(True)
+
+
+tf = lazy_import('tensorflow', on_import=_seed_tensorflow)
 
 # import remaining imports
-from tensorflow.keras import Input
-from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import Dense, Dropout
-from tensorflow.keras.optimizers import Adam
+Input = lazy_import('tensorflow.keras', 'Input', _seed_tensorflow)
+Sequential = lazy_import('tensorflow.keras.models', 'Sequential', _seed_tensorflow)
+Model = lazy_import('tensorflow.keras.models', 'Model', _seed_tensorflow)
+Dense = lazy_import('tensorflow.keras.layers', 'Dense', _seed_tensorflow)
+Dropout = lazy_import('tensorflow.keras.layers', 'Dropout', _seed_tensorflow)
+Adam = lazy_import('tensorflow.keras.optimizers', 'Adam', _seed_tensorflow)
 
-import numpy as np
-import matplotlib.pyplot as plt
+plt = lazy_import('matplotlib.pyplot')
 
 
 def build_dense_ae_architecture(input_dim, encoding_dim, droprate,
@@ -45,6 +115,9 @@ def build_dense_ae_architecture(input_dim, encoding_dim, droprate,
           must be 1D with a length that equals the number of values in any
           single observation's embedding
 
+    The hidden layers are encoding_dim*256, *64, *16, and *4 wide, see
+    build_dense_ae() for an autoencoder of configurable width
+
     :param input_dim: integer, the length of each embedding (must all be of
                       the same length)
     :param encoding_dim: integer, the desired bottleneck dimension for the
@@ -58,34 +131,223 @@ def build_dense_ae_architecture(input_dim, encoding_dim, droprate,
     :return: tuple of 3 tf.keras model object, [0] full autoencoder model,
              [1] encoder model, [2] decoder model
     """
+    return build_dense_ae(
+        input_dim, encoding_dim, droprate, learning_rate, name,
+        hidden_dims=taper_hidden_dims(encoding_dim*256, encoding_dim, 4),
+    )
+
+
+def taper_hidden_dims(max_width, encoding_dim, n_hidden):
+    """Returns encoder hidden layer widths tapering geometrically
+
+    The widths shrink by a constant factor from max_width towards
+    encoding_dim, so taper_hidden_dims(encoding_dim*256, encoding_dim, 4)
+    returns the encoding_dim*256, *64, *16, and *4 widths of
+    build_dense_ae_architecture()
+
+    :param max_width: integer, the width of the first (widest) hidden layer
+    :param encoding_dim: integer, the bottleneck dimension
+    :param n_hidden: integer, the number of hidden layers in the encoder
+
+    :return: tuple of n_hidden integers, the encoder hidden layer widths
+    """
+    ratio = encoding_dim/max_width
+    return tuple(
+        max(encoding_dim, int(round(max_width*ratio**(i/n_hidden))))
+        for i in range(n_hidden)
+    )
+
+
+def count_dense_ae_size(input_dim, encoding_dim, hidden_dims,
+                        tied_weights=False):
+    """Counts the parameters and per-observation FLOPs of a dense autoencoder
+
+    :param input_dim: integer, the length of each embedding
+    :param encoding_dim: integer, the bottleneck dimension
+    :param hidden_dims: sequence of integers, the encoder hidden layer widths
+                        (the decoder mirrors them in reverse)
+    :param tied_weights: boolean, whether the decoder reuses the transposed
+                         encoder kernels (default False)
+
+    :return: dict with keys 'params', the number of trainable parameters,
+             and 'flops', the multiply and add operations of one forward
+             pass of one observation (a training step costs about 3 times
+             this per observation)
+    """
+    dims = [input_dim] + list(hidden_dims) + [encoding_dim]
+    kernels = sum(a*b for a, b in zip(dims[:-1], dims[1:]))
+    encoder_biases = sum(dims[1:])
+    decoder_biases = sum(dims[:-1])
+    return {
+        'params': kernels*(1 if tied_weights else 2) + encoder_biases \
+            + decoder_biases,
+        'flops': 2*2*kernels,
+    }
+
+
+def _budget_hidden_dims(input_dim, encoding_dim, n_hidden, tied_weights,
+                        budget, budget_key):
+    """Returns the widest tapered hidden widths whose size fits the budget
+    """
+    def size(max_width):
+        return count_dense_ae_size(
+            input_dim, encoding_dim,
+            taper_hidden_dims(max_width, encoding_dim, n_hidden),
+            tied_weights,
+        )[budget_key]
+
+    if size(encoding_dim) > budget:
+        raise ValueError(
+            'A {} budget of {} is too small for even the narrowest '\
+            'network, which has {}'.format(
+                budget_key, budget, size(encoding_dim)
+            )
+        )
+
+    # bisect on the width of the first hidden layer
+    low, high = encoding_dim, max(encoding_dim, 1)*2
+    while size(high) <= budget:
+        low, high = high, high*2
+    while high - low > 1:
+        mid = (low + high)//2
+        if size(mid) <= budget:
+            low = mid
+        else:
+            high = mid
+
+    return taper_hidden_dims(low, encoding_dim, n_hidden)
+
+
+_tied_dense_class = []
+
+
+def _tied_dense(tied_to, activation):
+    """Returns a keras layer applying the transposed kernel of a Dense layer
+
+    The layer class is defined on first use so that tensorflow is only
+    imported when a tied network is built. Each layer has its own bias,
+    while the kernel is shared with (and trained through) tied_to.
+    """
+    if not _tied_dense_class:
+        class TiedDense(tf.keras.layers.Layer):
+            def __init__(self, tied_to, activation=None, **kwargs):
+                super().__init__(**kwargs)
+                self.tied_to = tied_to
+                self.activation = tf.keras.activations.get(activation)
+
+            def build(self, input_shape):
+                self.bias = self.add_weight(
+                    name='bias', shape=(self.tied_to.kernel.shape[0],),
+                    initializer='zeros', trainable=True,
+                )
+                super().build(input_shape)
+
+            def call(self, inputs):
+                return self.activation(
+                    tf.matmul(
+                        inputs, tf.convert_to_tensor(self.tied_to.kernel),
+                        transpose_b=True
+                    ) + self.bias
+                )
+
+        _tied_dense_class.append(TiedDense)
+
+    return _tied_dense_class[0](tied_to, activation)
+
+
+def build_dense_ae(input_dim, encoding_dim, droprate, learning_rate, name,
+                   hidden_dims=None, param_budget=None, flop_budget=None,
+                   n_hidden=4, tied_weights=False):
+    """Builds and compiles a dense autoencoder of configurable width
+
+    The encoder hidden layer widths are either given explicitly with
+    hidden_dims, or chosen as the widest geometric taper (see
+    taper_hidden_dims()) of n_hidden layers that fits param_budget or
+    flop_budget, as counted by count_dense_ae_size(). The decoder mirrors
+    the encoder. With tied_weights=True each decoder layer reuses the
+    transposed kernel of the matching encoder layer (with its own bias),
+    which halves the number of kernel parameters to train.
+
+    The hidden layers use relu activations with dropout between them and the
+    bottleneck and output layers are linear, as in
+    build_dense_ae_architecture(). The encoder can be exported with
+    export_encoder() either way, but only untied decoders consist of plain
+    Dense layers, and tied networks must be saved and restored with the
+    save_weights() and load_weights() methods of a network rebuilt with the
+    same arguments rather than with save().
+
+    :param input_dim: integer, the length of each embedding
+    :param encoding_dim: integer, the bottleneck dimension
+    :param droprate: float >=0 <1, the rate of the dropout layers after each
+                     hidden layer
+    :param learning_rate: float, the learning rate of the Adam optimizer
+    :param name: string, the desired name of the resulting network
+    :param hidden_dims: None or sequence of integers, the encoder hidden
+                        layer widths (default None)
+    :param param_budget: None or integer, the maximum number of trainable
+                         parameters (default None)
+    :param flop_budget: None or integer, the maximum FLOPs of one forward
+                        pass of one observation (default None)
+    :param n_hidden: integer, the number of encoder hidden layers used with
+                     a budget, or with neither hidden_dims nor a budget, in
+                     which case the encoding_dim*4**n_hidden wide taper of
+                     build_dense_ae_architecture() is used (default 4)
+    :param tied_weights: boolean, whether the decoder reuses the transposed
+                         encoder kernels (default False)
+
+    :return: tuple of 3 tf.keras model object, [0] full autoencoder model,
+             [1] encoder model, [2] decoder model
+    """
+    if sum(x is not None for x in [hidden_dims, param_budget, flop_budget])>1:
+        raise ValueError(
+            'Only one of hidden_dims, param_budget, and flop_budget can be set'
+        )
+    if param_budget is not None:
+        hidden_dims = _budget_hidden_dims(
+            input_dim, encoding_dim, n_hidden, tied_weights, param_budget,
+            'params'
+        )
+    elif flop_budget is not None:
+        hidden_dims = _budget_hidden_dims(
+            input_dim, encoding_dim, n_hidden, tied_weights, flop_budget,
+            'flops'
+        )
+    elif hidden_dims is None:
+        hidden_dims = taper_hidden_dims(
+            encoding_dim*4**n_hidden, encoding_dim, n_hidden
+        )
+
     # define encoder model
-    input_layer = Input(shape=input_dim)
-    
-    encoded = Dense(encoding_dim*256, activation='relu', use_bias=True)(input_layer)
-    encoded = Dropout(rate=droprate)(encoded)
-    encoded = Dense(encoding_dim*64, activation='relu', use_bias=True)(encoded)
-    encoded = Dropout(rate=droprate)(encoded)
-    encoded = Dense(encoding_dim*16, activation='relu', use_bias=True)(encoded)
-    encoded = Dropout(rate=droprate)(encoded)
-    encoded = Dense(encoding_dim*4, activation='relu', use_bias=True)(encoded)
-    encoded = Dropout(rate=droprate)(encoded)
-    encoded = Dense(encoding_dim, activation='linear', use_bias=True)(encoded)
-    
+    input_layer = Input(shape=(input_dim,))
+
+    encoded = input_layer
+    encoder_layers = []
+    for dim in hidden_dims:
+        encoder_layers.append(Dense(dim, activation='relu', use_bias=True))
+        encoded = encoder_layers[-1](encoded)
+        encoded = Dropout(rate=droprate)(encoded)
+    encoder_layers.append(
+        Dense(encoding_dim, activation='linear', use_bias=True)
+    )
+    encoded = encoder_layers[-1](encoded)
+
     encoder = Model(input_layer, encoded, name='{}_encoder'.format(name))
 
-    # define decoder model
+    # define decoder model, mirroring the encoder
     latent_input = Input(shape=(encoding_dim,))
-    
-    decoded = Dense(encoding_dim*4, activation='relu', use_bias=True)(latent_input)
-    decoded = Dropout(rate=droprate)(decoded)
-    decoded = Dense(encoding_dim*16, activation='relu', use_bias=True)(decoded)
-    decoded = Dropout(rate=droprate)(decoded)
-    decoded = Dense(encoding_dim*64, activation='relu', use_bias=True)(decoded)
-    decoded = Dropout(rate=droprate)(decoded)
-    decoded = Dense(encoding_dim*256, activation='relu', use_bias=True)(decoded)
-    decoded = Dropout(rate=droprate)(decoded)
-    decoded = Dense(input_dim, activation='linear', use_bias=True)(decoded)
-    
+
+    decoded = latent_input
+    output_dims = list(reversed(hidden_dims)) + [input_dim]
+    for i, dim in enumerate(output_dims):
+        activation = 'linear' if i==len(output_dims) - 1 else 'relu'
+        if tied_weights:
+            layer = _tied_dense(encoder_layers[-1 - i], activation)
+        else:
+            layer = Dense(dim, activation=activation, use_bias=True)
+        decoded = layer(decoded)
+        if activation=='relu':
+            decoded = Dropout(rate=droprate)(decoded)
+
     decoder = Model(latent_input, decoded, name='{}_decoder'.format(name))
 
     # define full non-linear autoencoder model
@@ -97,17 +359,580 @@ def build_dense_ae_architecture(input_dim, encoding_dim, droprate,
     )
 
     # set loss, optimizer, and compile model
-    loss = tf.keras.losses.mean_squared_error
-    optimizer = Adam(lr=learning_rate)
-
     ae.compile(
-        loss=loss,
-        optimizer=optimizer
+        loss=tf.keras.losses.MeanSquaredError(),
+        optimizer=Adam(learning_rate=learning_rate)
     )
 
     return ae, encoder, decoder
 
 
+def export_encoder(model, path, check_data=None):
+    """Exports encoder Dense weights to a .npz file for numpy-only encoding
+
+    The exported file can be loaded with inference.DenseNetwork.load() in a
+    process that never imports tensorflow, and its predict() method then
+    encodes batches of embeddings with dropout disabled, exactly as
+    encoder.predict() does.
+
+    :param model: either the encoder model or the full autoencoder model
+                  returned by build_dense_ae_architecture(), in which case
+                  only its first (encoder) sub-model is exported
+    :param path: string, the file path of the resulting .npz file
+    :param check_data: None or 2D array of embeddings, if provided the numpy
+                       encoding of this data is compared to the keras
+                       encoder's predictions
+
+    :return: None, or the float maximum absolute difference between numpy
+             and keras encodings if check_data is provided
+    """
+    encoder = model.layers[0] if isinstance(model, Sequential) else model
+    export_dense_npz(encoder, path)
+
+    if check_data is not None:
+        check_data = np.asarray(check_data, dtype=np.float32)
+        numpy_encoded = DenseNetwork.load(path).predict(check_data)
+        keras_encoded = encoder.predict(check_data)
+        return float(np.abs(numpy_encoded - keras_encoded).max())
+
+
+def _atomic_replace(write, path):
+    """Calls write(tmp_path) and then moves tmp_path to path in one step
+
+    tmp_path is in the same directory as path and ends with the same file
+    name, so keras infers the same save format from it. If path is an
+    existing directory (a tensorflow SavedModel) it is swapped out and then
+    deleted.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, '.tmp_{}'.format(filename))
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+
+    write(tmp_path)
+
+    if os.path.isdir(path):
+        old_path = os.path.join(directory, '.old_{}'.format(filename))
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+def export_dense_ae(encoder, decoder, encoder_path, decoder_path):
+    """Atomically saves the encoder and decoder of a fitted autoencoder
+
+    Each model is written next to its destination and then moved into place,
+    so an interrupted export never leaves a partially written model behind.
+    Paths ending in '.weights.h5' are saved with save_weights(), which is
+    required for the decoder of a build_dense_ae() network with tied
+    weights, and all other paths are saved with save().
+
+    :param encoder: tf.keras encoder model, [1] of build_dense_ae()
+    :param decoder: tf.keras decoder model, [2] of build_dense_ae()
+    :param encoder_path: string, the file path of the saved encoder
+    :param decoder_path: string, the file path of the saved decoder
+
+    :return: nothing is returned, the models are written to disk
+    """
+    for model, path in [(encoder, encoder_path), (decoder, decoder_path)]:
+        if path.endswith('.weights.h5'):
+            _atomic_replace(model.save_weights, path)
+        else:
+            _atomic_replace(model.save, path)
+
+
+def fit_dense_ae(ae, x, validation_data, checkpoint_dir, epochs=200,
+                 batch_size=16, checkpoint_every=1, patience=10,
+                 min_delta=0.0001, restore_best_weights=True, max_to_keep=2,
+                 verbose=0, **kwargs):
+    """Trains an autoencoder with resumable checkpoints and early stopping
+
+    Every checkpoint_every epochs the model weights and optimizer state are
+    written to checkpoint_dir with tf.train.CheckpointManager, together with
+    a 'state.json' file of the training history and early stopping state and
+    a 'best.npz' file of the weights with the lowest val_loss so far. If
+    checkpoint_dir already holds a checkpoint, for instance because a
+    previous run was killed, training resumes from it rather than from
+    epoch 0, and a run that already finished returns immediately.
+
+    Training stops early once val_loss has not improved by more than
+    min_delta for patience epochs, with the same defaults as the
+    tf.keras.callbacks.EarlyStopping callback used in notebook 03b, and the
+    weights with the lowest val_loss are then restored into ae. The encoder
+    and decoder can then be saved with export_dense_ae().
+
+    :param ae: compiled tf.keras autoencoder, [0] of build_dense_ae() or
+               build_dense_ae_architecture(), which must be rebuilt with the
+               same arguments when resuming
+    :param x: 2D np.array of training embeddings, or a tf.data.Dataset of
+              (x, x) batches such as one from make_ae_dataset()
+    :param validation_data: 2D np.array of validation embeddings, or a
+                            tf.data.Dataset of (x, x) batches
+    :param checkpoint_dir: string, the directory of the checkpoints
+    :param epochs: integer, the maximum number of training epochs
+                   (default 200)
+    :param batch_size: integer, the training batch size, ignored if x is a
+                       tf.data.Dataset (default 16)
+    :param checkpoint_every: integer, the number of epochs between
+                             checkpoints (default 1)
+    :param patience: integer, the number of epochs without improvement after
+                     which training stops (default 10)
+    :param min_delta: float, the minimum decrease in val_loss counted as an
+                      improvement (default 0.0001)
+    :param restore_best_weights: boolean, whether the weights with the lowest
+                                 val_loss are restored when training ends
+                                 (default True)
+    :param max_to_keep: integer, the number of recent checkpoints kept on
+                        disk (default 2)
+    :param verbose: integer, passed to the keras model.fit() method
+                    (default 0)
+    :param kwargs: additional arguments passed to the keras model.fit()
+                   method, including any additional callbacks
+
+    :return: dict of 'loss' and 'val_loss' lists over all epochs trained,
+             including those of earlier runs, which can be passed to
+             plot_history()
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    state_path = os.path.join(checkpoint_dir, 'state.json')
+    best_path = os.path.join(checkpoint_dir, 'best.npz')
+
+    checkpoint = tf.train.Checkpoint(model=ae, optimizer=ae.optimizer)
+    manager = tf.train.CheckpointManager(
+        checkpoint, checkpoint_dir, max_to_keep=max_to_keep
+    )
+
+    state = {
+        'epoch': 0,
+        'history': {'loss': [], 'val_loss': []},
+        'best_val_loss': None,
+        'best_epoch': None,
+        'wait': 0,
+        'stopped': False,
+        'checkpoint': None,
+    }
+    if os.path.isfile(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        checkpoint.restore(os.path.join(checkpoint_dir, state['checkpoint']))
+        if verbose:
+            print('Resuming from epoch {}'.format(state['epoch']))
+
+    # the best weights are kept in memory and only written at checkpoints,
+    # so best.npz always matches the best_val_loss in state.json
+    best_weights = []
+
+    def write_best_weights(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, *best_weights)
+
+    def write_state(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+
+    def write_checkpoint(epoch):
+        if best_weights:
+            _atomic_replace(write_best_weights, best_path)
+            del best_weights[:]
+        state['checkpoint'] = os.path.basename(
+            manager.save(checkpoint_number=epoch)
+        )
+        _atomic_replace(write_state, state_path)
+
+    def on_epoch_end(epoch, logs):
+        for key in ['loss', 'val_loss']:
+            state['history'][key].append(float(logs[key]))
+        state['epoch'] = epoch + 1
+
+        val_loss = float(logs['val_loss'])
+        if state['best_val_loss'] is None \
+                or val_loss < state['best_val_loss'] - min_delta:
+            state['best_val_loss'] = val_loss
+            state['best_epoch'] = epoch + 1
+            state['wait'] = 0
+            best_weights[:] = ae.get_weights()
+        else:
+            state['wait'] += 1
+
+        if state['wait'] >= patience:
+            state['stopped'] = True
+            ae.stop_training = True
+            if verbose:
+                print(
+                    'Epoch {}: early stopping, best val_loss {:.4f} at '\
+                    'epoch {}'.format(
+                        epoch + 1, state['best_val_loss'], state['best_epoch']
+                    )
+                )
+
+        if state['stopped'] or state['epoch']==epochs \
+                or state['epoch'] % checkpoint_every==0:
+            write_checkpoint(state['epoch'])
+
+    if isinstance(validation_data, np.ndarray):
+        validation_data = (validation_data, validation_data)
+
+    if not state['stopped'] and state['epoch'] < epochs:
+        fit_data = {'x': x} if isinstance(x, tf.data.Dataset) \
+            else {'x': x, 'y': x, 'batch_size': batch_size}
+        ae.fit(
+            validation_data=validation_data,
+            initial_epoch=state['epoch'],
+            epochs=epochs,
+            callbacks=kwargs.pop('callbacks', []) + [
+                tf.keras.callbacks.LambdaCallback(on_epoch_end=on_epoch_end)
+            ],
+            verbose=verbose,
+            **fit_data,
+            **kwargs
+        )
+
+    if restore_best_weights and os.path.isfile(best_path):
+        with np.load(best_path) as npz:
+            ae.set_weights(
+                [npz['arr_{}'.format(i)] for i in range(len(npz.files))]
+            )
+
+    return state['history']
+
+
+def make_ae_dataset(embeddings, indices=None, batch_size=16, shuffle=True,
+                    shuffle_buffer=10000, cache=None, seed=random_seed):
+    """Builds a tf.data pipeline of (x, x) embedding batches for an autoencoder
+
+    Rows are gathered from the embeddings array one batch at a time in
+    parallel background threads, so a memory-mapped array (for instance
+    embeddings.EmbeddingStore().embeddings) is streamed from disk as float32
+    without ever being copied in full, and batches are prefetched while the
+    model trains. The resulting dataset can be passed directly to the
+    model.fit() method of the autoencoder from build_dense_ae_architecture().
+
+    With cache=None, the row indices (not the rows) are fully shuffled each
+    epoch, which keeps memory flat. If cache is set, the float32 rows are
+    cached after the first epoch, in memory if cache='' or otherwise in the
+    file at that path, and then shuffled with a buffer of shuffle_buffer rows.
+
+    :param embeddings: 2D np.array or np.memmap of embeddings
+    :param indices: None or array-like of row positions to include, for
+                    instance to build separate training and validation
+                    datasets from the same array (default None uses all)
+    :param batch_size: integer, the training batch size (default 16)
+    :param shuffle: boolean, whether rows are shuffled each epoch, which
+                    should be False for validation data (default True)
+    :param shuffle_buffer: integer, the shuffle buffer size used when cache
+                           is set (default 10000)
+    :param cache: None or string, see above (default None)
+    :param seed: integer, the shuffle seed (default random_seed)
+
+    :return: tf.data.Dataset yielding (x, x) float32 batches
+    """
+    if indices is None:
+        indices = np.arange(len(embeddings))
+    indices = np.asarray(indices, dtype=np.int64)
+    input_dim = embeddings.shape[1]
+
+    def gather(batch_indices):
+        # read rows in sorted order for sequential access to memmap pages
+        return np.asarray(
+            embeddings[np.sort(batch_indices)], dtype=np.float32
+        )
+
+    def gather_batch(batch_indices):
+        batch = tf.numpy_function(gather, [batch_indices], tf.float32)
+        batch.set_shape([None, input_dim])
+        return batch
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+
+    if cache is None:
+        if shuffle:
+            dataset = dataset.shuffle(
+                len(indices), seed=seed, reshuffle_each_iteration=True
+            )
+        dataset = dataset.batch(batch_size).map(
+            gather_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+    else:
+        # gather rows in larger sequential blocks before caching them
+        dataset = dataset.batch(max(batch_size, 1024)).map(
+            gather_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        ).unbatch().cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(
+                shuffle_buffer, seed=seed, reshuffle_each_iteration=True
+            )
+        # unbatch() loses the known number of batches, so restore it
+        dataset = dataset.batch(batch_size).apply(
+            tf.data.experimental.assert_cardinality(
+                -(-len(indices) // batch_size)
+            )
+        )
+
+    return dataset.map(lambda x: (x, x)).prefetch(
+        tf.data.experimental.AUTOTUNE
+    )
+
+
+sweep_params = ['encoding_dim', 'droprate', 'learning_rate', 'batch_size']
+
+
+def _init_sweep_worker(intra_threads, inter_threads):
+    """Pins the tensorflow thread pools of a sweep worker process
+
+    This must run before tensorflow executes any op in the process, which is
+    why sweep workers are started with the 'spawn' method.
+    """
+    os.environ['OMP_NUM_THREADS'] = str(intra_threads)
+    tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+
+
+def _train_sweep_trial(name, params, data_path, train_idx, val_idx,
+                       initial_epoch, epochs, model_path):
+    """Trains one sweep trial from initial_epoch up to epochs
+
+    A new model is built if initial_epoch is 0, otherwise the model (with its
+    optimizer state) saved at model_path by the previous rung is resumed.
+
+    :return: tuple, [0] name, [1] dict of the history of this rung
+    """
+    tf.keras.backend.clear_session()
+    tf.random.set_seed(random_seed)
+    embeddings = np.load(data_path, mmap_mode='r')
+
+    if initial_epoch==0:
+        ae, _, _ = build_dense_ae_architecture(
+            embeddings.shape[1], params['encoding_dim'], params['droprate'],
+            params['learning_rate'], name
+        )
+    else:
+        ae = tf.keras.models.load_model(model_path)
+
+    history = ae.fit(
+        make_ae_dataset(
+            embeddings, train_idx, batch_size=params['batch_size'],
+            seed=random_seed + initial_epoch
+        ),
+        validation_data=make_ae_dataset(
+            embeddings, val_idx, batch_size=params['batch_size'],
+            shuffle=False
+        ),
+        initial_epoch=initial_epoch,
+        epochs=epochs,
+        verbose=0,
+    )
+    ae.save(model_path)
+
+    return name, {
+        key: [float(value) for value in values]
+        for key, values in history.history.items()
+    }
+
+
+def sweep_dense_ae(embeddings, param_grid, sweep_dir, val_fraction=0.1,
+                   min_epochs=5, max_epochs=45, eta=3, n_workers=None,
+                   intra_threads=None, inter_threads=1, verbose=True):
+    """Trains a grid of dense autoencoders in parallel with successive halving
+
+    Every combination of the values in param_grid is built with
+    build_dense_ae_architecture() and trained in a pool of worker processes,
+    each of which pins tensorflow to intra_threads intra-op and inter_threads
+    inter-op threads so that concurrent trials do not oversubscribe the CPU.
+    Training proceeds in rungs of min_epochs, min_epochs*eta,
+    min_epochs*eta**2, ... epochs up to max_epochs. After each rung only the
+    best 1/eta of the trials, ranked by their lowest val_loss so far, resume
+    training (with their optimizer state) into the next rung.
+
+    The embeddings are written once to sweep_dir and memory-mapped by every
+    worker, and each trial's latest model is saved to sweep_dir as
+    '<trial name>.keras' for reloading with tf.keras.models.load_model().
+    Workers are started with the 'spawn' method, so in a script this
+    function must be called under an if __name__=='__main__': guard.
+
+    :param embeddings: 2D np.array of embeddings, or string path to a .npy
+                       file of embeddings
+    :param param_grid: dict with keys 'encoding_dim', 'droprate',
+                       'learning_rate', and 'batch_size', each mapped to a
+                       list of values to sweep
+    :param sweep_dir: string, the directory to which the embeddings and
+                      trial models are written (created if needed)
+    :param val_fraction: float, the fraction of rows randomly held out as
+                         validation data (default 0.1)
+    :param min_epochs: integer, the number of epochs in the first rung
+                       (default 5)
+    :param max_epochs: integer, the number of epochs trained by the trials
+                       that survive to the last rung (default 45)
+    :param eta: integer >=2, the halving rate, the number of epochs grows and
+                the number of trials shrinks by this factor each rung
+                (default 3)
+    :param n_workers: integer or None, the number of worker processes
+                      (default None uses one per CPU, up to the number of
+                      trials)
+    :param intra_threads: integer or None, the intra-op threads of each
+                          worker (default None divides the CPUs evenly among
+                          the workers)
+    :param inter_threads: integer, the inter-op threads of each worker
+                          (default 1)
+    :param verbose: boolean, whether the surviving trials of each rung are
+                    printed (default True)
+
+    :return: dict of trial dicts keyed by trial name, each with keys 'params'
+             (dict of this trial's param_grid values), 'history' (dict of
+             'loss' and 'val_loss' lists, which can be passed to
+             plot_history()), 'epochs' (integer number of epochs trained),
+             'best_val_loss' (float), and 'model_path' (string)
+    """
+    missing = [param for param in sweep_params if param not in param_grid]
+    if missing:
+        raise ValueError('param_grid is missing the keys {}'.format(missing))
+
+    os.makedirs(sweep_dir, exist_ok=True)
+    if isinstance(embeddings, str):
+        data_path = embeddings
+    else:
+        data_path = os.path.join(sweep_dir, 'embeddings.npy')
+        np.save(data_path, np.asarray(embeddings, dtype=np.float32))
+
+    # hold out the same randomly selected validation rows for every trial
+    n_rows = len(np.load(data_path, mmap_mode='r'))
+    n_val = max(1, int(round(n_rows*val_fraction)))
+    shuffled = np.random.RandomState(random_seed).permutation(n_rows)
+    val_idx = np.sort(shuffled[:n_val])
+    train_idx = np.sort(shuffled[n_val:])
+
+    results = {}
+    for values in itertools.product(*[param_grid[p] for p in sweep_params]):
+        params = dict(zip(sweep_params, values))
+        name = 'ae_{}dim_drop{}_lr{}_batch{}'.format(*values)
+        results[name] = {
+            'params': params,
+            'history': {'loss': [], 'val_loss': []},
+            'epochs': 0,
+            'best_val_loss': np.inf,
+            'model_path': os.path.join(sweep_dir, '{}.keras'.format(name)),
+        }
+
+    # epoch budget of each rung
+    rungs = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    rungs.append(max_epochs)
+
+    n_cpus = os.cpu_count() or 1
+    if n_workers is None:
+        n_workers = min(n_cpus, len(results))
+    if intra_threads is None:
+        intra_threads = max(1, n_cpus//n_workers)
+
+    active = list(results)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_sweep_worker,
+        initargs=(intra_threads, inter_threads),
+    ) as executor:
+        for rung, rung_epochs in enumerate(rungs):
+            futures = [
+                executor.submit(
+                    _train_sweep_trial, name, results[name]['params'],
+                    data_path, train_idx, val_idx, results[name]['epochs'],
+                    rung_epochs, results[name]['model_path']
+                ) for name in active
+            ]
+            for future in futures:
+                name, history = future.result()
+                for key in ['loss', 'val_loss']:
+                    results[name]['history'][key] += history[key]
+                results[name]['epochs'] = rung_epochs
+                results[name]['best_val_loss'] = min(
+                    results[name]['history']['val_loss']
+                )
+
+            active = sorted(
+                active, key=lambda name: results[name]['best_val_loss']
+            )
+            last_rung = rung==len(rungs) - 1
+            if not last_rung:
+                active = active[:max(1, ceil(len(active)/eta))]
+
+            if verbose:
+                print(
+                    'rung {}, {} epochs, {}:'.format(
+                        rung, rung_epochs,
+                        'final ranking' if last_rung
+                        else '{} trials continue'.format(len(active))
+                    )
+                )
+                for name in active:
+                    print(
+                        '\t{}\tbest val_loss {:.4f}'.format(
+                            name, results[name]['best_val_loss']
+                        )
+                    )
+
+    return results
+
+
+def fit_parametric_umap(mapper, hidden_dims=(256, 128, 64), droprate=0.0,
+                        learning_rate=0.001, epochs=100, batch_size=256,
+                        validation_split=0.1, name='parametric_umap',
+                        **kwargs):
+    """Trains a dense network that regresses a fitted UMAP mapper's embedding
+
+    The network learns to map each observation in the mapper's training data
+    to its fitted UMAP embedding, so new observations can be embedded with a
+    few deterministic matrix multiplies rather than mapper.transform(), which
+    runs a nearest neighbor search and SGD layout refinement for every new
+    point. Export the fitted network with inference.export_dense_npz() and
+    load it with inference.DenseNetwork for tensorflow-free inference.
+
+    :param mapper: fitted umap.UMAP object
+    :param hidden_dims: tuple of integers, the width of each hidden relu
+                        layer (default (256, 128, 64))
+    :param droprate: float >=0 <1, the dropout rate between hidden layers
+                     (default 0.0 adds no dropout layers)
+    :param learning_rate: float, the learning rate for the Adam optimizer
+    :param epochs: integer, the number of training epochs
+    :param batch_size: integer, the training batch size
+    :param validation_split: float, the fraction of training data held out
+                             to report val_loss
+    :param name: string, the desired name of the resulting network
+    :param kwargs: additional arguments passed to the keras model.fit()
+                   method
+
+    :return: tuple, [0] fitted tf.keras model object, [1] keras history
+             object, which can be passed to plot_history()
+    """
+    X = np.asarray(mapper._raw_data, dtype=np.float32)
+    y = np.asarray(mapper.embedding_, dtype=np.float32)
+
+    input_layer = Input(shape=(X.shape[1],))
+    output = input_layer
+    for dim in hidden_dims:
+        output = Dense(dim, activation='relu', use_bias=True)(output)
+        if droprate > 0:
+            output = Dropout(rate=droprate)(output)
+    output = Dense(y.shape[1], activation='linear', use_bias=True)(output)
+
+    model = Model(input_layer, output, name=name)
+    model.compile(
+        loss=tf.keras.losses.MeanSquaredError(),
+        optimizer=Adam(learning_rate=learning_rate)
+    )
+
+    history = model.fit(
+        X, y, epochs=epochs, batch_size=batch_size,
+        validation_split=validation_split, **kwargs
+    )
+
+    return model, history
+
+
 def plot_history(history, title, val_name='validation', loss_type='MSE'):
     """Plot training and validation loss using keras history object
     
@@ -4,14 +4,28 @@ This module contains functions for visualizing data and model results
 FUNCTIONS
 
     silplot()
-        Generates silhouette subplot of kmeans clusters alongside PCA n=2
+        Generates silhouette subplot of kmeans clusters alongside PCA n=2,
+        on a sample of dense or sparse data
+
+    fit_minibatch_kmeans()
+        Fits or updates mini-batch kmeans over chunked, optionally sparse,
+        input data with a KMeans-compatible interface
 
     display_gapstat_with_errbars()
         Generates plots of gap stats with error bars for each number of
         clusters
 
+    compute_gap_statistic()
+        Calculates gap statistics for a range of k values in parallel,
+        caching reference dispersions for reuse, and returns a gap_df
+
     fit_neighbors()
-        Fits n nearest neighbors based on min samples and returns distances
+        Fits n nearest neighbors based on min samples and returns distances,
+        using either exact search or an approximate NN-descent index
+
+    neighbors_recall()
+        Estimates the recall of approximate nearest neighbors against exact
+        search on a sample of observations
 
     plot_epsilon()
         Plot epsilon by index sorted by increasing distance
@@ -23,10 +37,18 @@ FUNCTIONS
     fit_dbscan()
         Fits dbscan and returns dictionary of results including model, labels,
         indices
+
+    dbscan_grid()
+        Generates fit_dbscan style results for a grid of eps and min_samples
+        values from a single precomputed radius neighbors graph
     
     print_dbscan_results()
         Prints summary results of fitted dbscan_dict
 
+    build_linkage()
+        Generates hierarchical clustering linkage data, using O(n) memory
+        single and ward algorithms or a condensed distance matrix
+
     plot_dendrogram()
         Plots a dendrogram given a set of input hierarchy linkage data
 
@@ -39,50 +61,101 @@ FUNCTIONS
     plot_category_scatter()
         plots scatterplot with categories colors
 
+    save_mapper_bundle()
+        Saves a nested dict of fitted UMAP mappers as a bundle directory with
+        one memory-mappable file per array and a json manifest
+
+    load_mapper_bundle()
+        Lazily loads a mapper bundle, unpickling and memory-mapping each
+        mapper only when it is first accessed
+
 CLASSES
 
+    HDBSCAN_predictor()
+        Vectorized, batched equivalent of hdbscan.approximate_predict for
+        scoring new observations against a fitted HDBSCAN clusterer
+
     UMAP_embedder()
         Used for UMAP embedding section of final report
 
 """
 
+import os
+import json
+import pickle
+import hashlib
 from math import pi
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-
-from sklearn.decomposition import PCA
-import scipy.cluster.hierarchy as hac
-from scipy.spatial.distance import pdist
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import DBSCAN
-from sklearn.neighbors import NearestNeighbors
-from sklearn.metrics import silhouette_samples, silhouette_score
-import matplotlib.cm as cm
-
-from sklearn.cluster import KMeans
-from gap_statistic import OptimalK
-import scipy.cluster.hierarchy as hac
 
+from .lazy import lazy_import
 from .visualize import plot_line, plot_value_counts
+from .embeddings import EmbeddingStore
+
+plt = lazy_import('matplotlib.pyplot')
+cm = lazy_import('matplotlib.cm')
+
+PCA = lazy_import('sklearn.decomposition', 'PCA')
+TruncatedSVD = lazy_import('sklearn.decomposition', 'TruncatedSVD')
+hac = lazy_import('scipy.cluster.hierarchy')
+pdist = lazy_import('scipy.spatial.distance', 'pdist')
+sparse = lazy_import('scipy.sparse')
+csr_matrix = lazy_import('scipy.sparse', 'csr_matrix')
+connected_components = lazy_import(
+    'scipy.sparse.csgraph', 'connected_components'
+)
+StandardScaler = lazy_import('sklearn.preprocessing', 'StandardScaler')
+DBSCAN = lazy_import('sklearn.cluster', 'DBSCAN')
+KMeans = lazy_import('sklearn.cluster', 'KMeans')
+MiniBatchKMeans = lazy_import('sklearn.cluster', 'MiniBatchKMeans')
+NearestNeighbors = lazy_import('sklearn.neighbors', 'NearestNeighbors')
+silhouette_samples = lazy_import('sklearn.metrics', 'silhouette_samples')
+silhouette_score = lazy_import('sklearn.metrics', 'silhouette_score')
 
 # Define plotting function to generate plot of gap stats with error bars
 
 
-def silplot(X, cluster_labels, clusterer, pointlabels=None, height=6):
+def silplot(X, cluster_labels, clusterer, pointlabels=None, height=6,
+            sample_size=10000, random_state=109):
     """Generates silhouette subplot of kmeans clusters alongside PCA n=2
 
+    X may be a scipy sparse matrix, such as the one-hot input of
+    fit_minibatch_kmeans(), in which case TruncatedSVD is used in place of
+    PCA so that X is never densified. Because silhouette values need all
+    pairwise distances, they are computed on a random sample of at most
+    sample_size observations.
+
     Source: The majority of the code from this function was provided as a
             helper function from the CS109b staff in HW2
 
             The original code authored by the cs109b teaching staff
             is modified from:
             http://scikit-learn.org/stable/auto_examples/cluster/plot_kmeans_silhouette_analysis.html
- 
+
+    :param sample_size: integer or None, the maximum number of observations
+                        used for the silhouette values, None uses all of
+                        them (default 10000)
+    :param random_state: integer, seed used to draw the silhouette sample
     """
     
     n_clusters = clusterer.n_clusters
+    cluster_labels = np.asarray(cluster_labels)
+    if sparse.issparse(X):
+        X = X.tocsr()
+    n_samples = X.shape[0]
+
+    if sample_size is not None and sample_size < n_samples:
+        rng = np.random.default_rng(random_state)
+        sample = np.sort(
+            rng.choice(n_samples, size=sample_size, replace=False)
+        )
+    else:
+        sample = np.arange(n_samples)
+    X_sample = X.values[sample] if isinstance(X, pd.DataFrame) else X[sample]
+    sample_labels = cluster_labels[sample]
     
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, height))
 
@@ -90,25 +163,22 @@ def silplot(X, cluster_labels, clusterer, pointlabels=None, height=6):
     # The silhouette coefficient can range from -1, 1 but in this example all
     # lie within [-0.1, 1]
     ax1.set_xlim([-0.1, 1])
-    
     # The (n_clusters+1)*10 is for inserting blank space between silhouette
     # plots of individual clusters, to demarcate them clearly.
-    ax1.set_ylim([0, len(X) + (n_clusters + 1) * 10])
+    ax1.set_ylim([0, len(sample) + (n_clusters + 1) * 10])
 
-    # The silhouette_score gives the average value for all the samples.
-    # This gives a perspective into the density and separation of the formed
-    # clusters
-    silhouette_avg = silhouette_score(X, cluster_labels)
-
-    # Compute the silhouette scores for each sample
-    sample_silhouette_values = silhouette_samples(X, cluster_labels)
+    # Compute the silhouette scores for each sampled observation, their
+    # average gives a perspective into the density and separation of the
+    # formed clusters
+    sample_silhouette_values = silhouette_samples(X_sample, sample_labels)
+    silhouette_avg = sample_silhouette_values.mean()
 
     y_lower = 10
     for i in range(0,n_clusters+1):
         # Aggregate the silhouette scores for samples belonging to
         # cluster i, and sort them
         ith_cluster_silhouette_values = \
-            sample_silhouette_values[cluster_labels == i]
+            sample_silhouette_values[sample_labels == i]
 
         ith_cluster_silhouette_values.sort()
 
@@ -143,8 +213,11 @@ def silplot(X, cluster_labels, clusterer, pointlabels=None, height=6):
     # 2nd Plot showing the actual clusters formed
     colors = cm.nipy_spectral(cluster_labels.astype(float) / n_clusters)
     
-    pca = PCA(n_components=2).fit(X)
-    X_pca = pca.transform(X) 
+    if sparse.issparse(X):
+        pca = TruncatedSVD(n_components=2, random_state=random_state).fit(X)
+    else:
+        pca = PCA(n_components=2).fit(X)
+    X_pca = pca.transform(X)
     ax2.scatter(X_pca[:, 0], X_pca[:, 1], marker='.', s=200, lw=0, alpha=0.7,
                 c=colors, edgecolor='k')
     xs = X_pca[:, 0]
@@ -185,6 +258,63 @@ def silplot(X, cluster_labels, clusterer, pointlabels=None, height=6):
     plt.show()
 
 
+def fit_minibatch_kmeans(data, n_clusters=None, batch_size=1024,
+                         n_epochs=1, model=None, random_state=109, **kwargs):
+    """Fits or updates mini-batch kmeans over chunked, optionally sparse, data
+
+    Data are passed to MiniBatchKMeans.partial_fit() in slices of batch_size
+    rows, so sparse one-hot inputs such as those returned by
+    scale.encode_categories_sparse() are never densified. Passing a
+    previously fitted model continues training it on the new data, which
+    allows clusters to be updated as new projects arrive. The returned model
+    exposes n_clusters and cluster_centers_ and can be passed to silplot().
+
+    :param data: np.array, dataframe, or scipy sparse matrix, or an iterable
+                 of such chunks (for instance a generator reading a large
+                 file in pieces)
+    :param n_clusters: integer, the number of clusters, required unless a
+                       fitted model is provided
+    :param batch_size: integer, the number of rows in each mini-batch
+                       (default 1024)
+    :param n_epochs: integer, the number of passes over in-memory data, a
+                     generator of chunks can only be passed over once
+                     (default 1)
+    :param model: None or a previously fitted MiniBatchKMeans object to
+                  continue training (default None)
+    :param random_state: integer, seed passed to MiniBatchKMeans
+    :param kwargs: additional arguments passed to MiniBatchKMeans when a new
+                   model is initialized
+
+    :return: fitted sklearn.cluster.MiniBatchKMeans object
+    """
+    if model is None:
+        if n_clusters is None:
+            raise ValueError('n_clusters is required if no model is provided')
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters, batch_size=batch_size,
+            random_state=random_state, **kwargs
+        )
+
+    # the first partial_fit call initializes centers from its batch, so it
+    # must contain at least n_clusters rows
+    batch_size = max(batch_size, model.n_clusters)
+
+    in_memory = isinstance(data, (np.ndarray, pd.DataFrame)) \
+        or sparse.issparse(data)
+    if in_memory:
+        chunks = [data] * n_epochs
+    else:
+        chunks = data
+
+    for chunk in chunks:
+        if isinstance(chunk, pd.DataFrame):
+            chunk = chunk.values
+        for start in range(0, chunk.shape[0], batch_size):
+            model.partial_fit(chunk[start:start + batch_size])
+
+    return model
+
+
 def display_gapstat_with_errbars(gap_df, height=4):
     """Generates plots of gap stats with error bars for each number of clusters
     """
@@ -215,16 +345,271 @@ def display_gapstat_with_errbars(gap_df, height=4):
     plt.show()
     
 
+def _kmeans_log_dispersion(data, k, n_init, random_state):
+    """Fits kmeans at k clusters and returns the log within-cluster dispersion
+    """
+    fitted_kmeans = KMeans(
+        n_clusters=k, n_init=n_init, random_state=random_state
+    ).fit(data)
+    return np.log(fitted_kmeans.inertia_)
+
+
+def _reference_log_dispersions(shape, lower, upper, ref_seed, k_list,
+                               n_init, random_state):
+    """Draws one uniform reference dataset and fits kmeans for each k
+
+    Each reference dataset is drawn from its own spawned seed, so the same
+    reference is reproduced regardless of which worker generates it.
+
+    :return: list of log dispersions, one for each value in k_list
+    """
+    rng = np.random.default_rng(ref_seed)
+    ref_data = rng.uniform(lower, upper, size=shape)
+    return [
+        _kmeans_log_dispersion(ref_data, k, n_init, random_state)
+        for k in k_list
+    ]
+
+
+# cache of reference log dispersions keyed by (shape, bounds, seed, n_init),
+# each value is a dict keyed by (reference number, k)
+_gap_reference_cache = {}
+
+
+def compute_gap_statistic(data, cluster_array, n_refs=20, n_init=10,
+                          random_state=109, n_jobs=None, use_cache=True):
+    """Calculates gap statistics for a range of k values and returns a gap_df
+
+    Uniform reference datasets are drawn once per reference over the bounding
+    box of the input data, and the kmeans fits for every (reference, k) pair
+    are distributed across a process pool. Reference dispersions are cached
+    by data shape, bounds, seed, and n_init, so re-running with a new or
+    extended cluster_array (or more n_refs) only fits the missing
+    combinations.
+
+    :param data: np.array or dataframe, the data on which to fit kmeans
+    :param cluster_array: list of integers, the k values to evaluate
+    :param n_refs: integer, the number of uniform reference datasets drawn
+                   for each value of k (default 20)
+    :param n_init: integer, passed to the n_init argument of KMeans
+    :param random_state: integer, seed used both for KMeans and for drawing
+                         the reference datasets (default 109)
+    :param n_jobs: integer or None, the number of worker processes used for
+                   the reference fits, None uses all available cores and 1
+                   fits everything in the current process
+    :param use_cache: boolean, whether cached reference dispersions are
+                      reused and new ones stored (default True)
+
+    :return: pd.DataFrame with the same 'n_clusters', 'gap_value', and 'diff'
+             columns as gap_statistic.OptimalK().gap_df, plus
+             'ref_dispersion_std' and 'sk', which can be passed directly to
+             display_gapstat_with_errbars()
+    """
+    data = np.asarray(data, dtype=float)
+    k_list = [int(k) for k in cluster_array]
+    lower = data.min(axis=0)
+    upper = data.max(axis=0)
+
+    # the b-th spawned seed does not depend on n_refs, so references are
+    # cached individually and only the settings of the fits are in the key
+    cache_key = (
+        data.shape, lower.tobytes(), upper.tobytes(), random_state, n_init
+    )
+    ref_cache = _gap_reference_cache.setdefault(cache_key, {}) \
+        if use_cache else {}
+
+    # spawn one independent seed per reference dataset
+    ref_seeds = np.random.SeedSequence(random_state).spawn(n_refs)
+
+    # identify the k values each reference still needs fitted
+    missing = {
+        b: [k for k in k_list if (b, k) not in ref_cache]
+        for b in range(n_refs)
+    }
+    missing = {b: ks for b, ks in missing.items() if len(ks)}
+
+    if len(missing):
+        args = [
+            (data.shape, lower, upper, ref_seeds[b], ks, n_init, random_state)
+            for b, ks in missing.items()
+        ]
+        if n_jobs == 1:
+            results = [_reference_log_dispersions(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(
+                    executor.map(_reference_log_dispersions, *zip(*args))
+                )
+
+        for (b, ks), log_dispersions in zip(missing.items(), results):
+            for k, log_dispersion in zip(ks, log_dispersions):
+                ref_cache[(b, k)] = log_dispersion
+
+    ref_log_dispersions = np.array(
+        [[ref_cache[(b, k)] for b in range(n_refs)] for k in k_list]
+    )
+    log_dispersions = np.array(
+        [_kmeans_log_dispersion(data, k, n_init, random_state) for k in k_list]
+    )
+
+    gap_df = pd.DataFrame({
+        'n_clusters': k_list,
+        'gap_value': ref_log_dispersions.mean(axis=1) - log_dispersions,
+        'ref_dispersion_std': ref_log_dispersions.std(axis=1),
+    })
+    gap_df['sk'] = gap_df['ref_dispersion_std'] * np.sqrt(1 + 1 / n_refs)
+    gap_df['diff'] = gap_df['gap_value'] - gap_df['gap_value'].shift(-1) \
+                     + gap_df['sk'].shift(-1)
+
+    return gap_df
+
+
 # Define functions for identifying epsilon values, fitting dbscan, and evaluating results
 
-def fit_neighbors(data, min_samples):
+def fit_neighbors(data, min_samples, method='exact', index_path=None,
+                  return_indices=False, random_state=109, **kwargs):
     """Fits n nearest neighbors based on min samples and returns distances
+
+    The 'nndescent' method builds an approximate nearest neighbor graph
+    in-process using pynndescent (installed as a dependency of umap), which
+    returns k-distance curves for large, high-dimensional embedding sets far
+    faster than exact search. If index_path is provided, a previously saved
+    index at that path is loaded instead of being rebuilt, as long as it was
+    built from the same data, metric and random_state, and a newly built
+    index is saved there for reuse.
+
+    :param data: np.array or dataframe, the data on which to fit neighbors
+    :param min_samples: integer, the number of neighbors to return for each
+                        observation (including the observation itself)
+    :param method: string, either 'exact' for sklearn NearestNeighbors or
+                   'nndescent' for the approximate index (default 'exact')
+    :param index_path: string or None, file path used to persist and reload
+                       the approximate index, ignored by the 'exact' method
+    :param return_indices: boolean, if True the neighbor indices are also
+                           returned (default False)
+    :param random_state: integer, seed used to build the approximate index
+    :param kwargs: additional arguments passed to pynndescent.NNDescent
+
+    :return: np.array of distances with shape (n, min_samples), or a tuple of
+             distances and indices arrays if return_indices=True
     """
-    fitted_neigbors = NearestNeighbors(n_neighbors=min_samples).fit(data)
-    distances, indices = fitted_neigbors.kneighbors(data)
+    if method not in ['exact', 'nndescent']:
+        raise ValueError(
+            "method only accepts 'exact' or 'nndescent', "\
+            "but you have entered: {}".format(method)
+        )
+
+    if method=='exact':
+        fitted_neigbors = NearestNeighbors(n_neighbors=min_samples).fit(data)
+        distances, indices = fitted_neigbors.kneighbors(data)
+
+    else:
+        index = _load_or_build_nndescent(
+            data, min_samples, index_path, random_state, **kwargs
+        )
+        indices, distances = index.neighbor_graph
+        indices = indices[:, :min_samples]
+        distances = distances[:, :min_samples]
+
+    if return_indices:
+        return distances, indices
     return distances
 
 
+def _nndescent_fingerprint(data, random_state, **kwargs):
+    """Returns a string identifying the data and settings of an NN-descent
+    index, a sha256 hash of the data together with its shape, the metric,
+    the random_state and any other NNDescent arguments
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(data).tobytes())
+    settings = {
+        'shape': list(data.shape),
+        'metric': kwargs.pop('metric', 'euclidean'),
+        'random_state': random_state,
+        'kwargs': {k: repr(v) for k, v in sorted(kwargs.items())},
+    }
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _load_or_build_nndescent(data, n_neighbors, index_path=None,
+                             random_state=109, **kwargs):
+    """Loads a persisted NN-descent index or builds (and saves) a new one
+
+    A fingerprint of the data, metric and random_state is saved next to the
+    index (at index_path + '.fingerprint'), and a loaded index is only
+    reused if its fingerprint matches and it has at least n_neighbors
+    neighbors.
+    """
+    from pynndescent import NNDescent
+
+    data = np.asarray(data, dtype=np.float32)
+
+    if index_path is not None:
+        fingerprint = _nndescent_fingerprint(data, random_state, **kwargs)
+        fingerprint_path = index_path + '.fingerprint'
+
+    if index_path is not None and os.path.exists(index_path) \
+            and os.path.exists(fingerprint_path):
+        with open(fingerprint_path) as f:
+            saved_fingerprint = f.read().strip()
+        if saved_fingerprint==fingerprint:
+            with open(index_path, 'rb') as f:
+                index = pickle.load(f)
+            if index.neighbor_graph[0].shape[1]>=n_neighbors:
+                return index
+
+    # build the graph with at least 30 neighbors because NN-descent recall
+    # degrades quickly for very small neighbor lists
+    index = NNDescent(
+        data, n_neighbors=max(n_neighbors, 30), random_state=random_state,
+        **kwargs
+    )
+
+    if index_path is not None:
+        with open(index_path, 'wb') as f:
+            pickle.dump(index, f)
+        with open(fingerprint_path, 'w') as f:
+            f.write(fingerprint)
+
+    return index
+
+
+def neighbors_recall(data, indices, sample_size=1000, random_state=109):
+    """Estimates recall of approximate neighbor indices against exact search
+
+    :param data: np.array or dataframe, the data used to build the neighbors
+    :param indices: np.array of approximate neighbor indices with shape
+                    (n, k), such as returned by fit_neighbors() with
+                    return_indices=True
+    :param sample_size: integer, the number of observations for which exact
+                        neighbors are computed for comparison (default 1000)
+    :param random_state: integer, seed used to draw the sample
+
+    :return: float, the fraction of the exact k nearest neighbors recovered
+             by the approximate indices, averaged over the sampled rows
+    """
+    data = np.asarray(data)
+    n_samples, k = indices.shape
+
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(
+        n_samples, size=min(sample_size, n_samples), replace=False
+    )
+
+    fitted_neighbors = NearestNeighbors(n_neighbors=k).fit(data)
+    exact_indices = fitted_neighbors.kneighbors(
+        data[sample], return_distance=False
+    )
+
+    hits = [
+        len(np.intersect1d(approx, exact, assume_unique=True))
+        for approx, exact in zip(indices[sample], exact_indices)
+    ]
+    return np.sum(hits) / exact_indices.size
+
+
 def plot_epsilon(distances, min_samples, height=5):
     """Plot epsilon by index sorted by increasing distance
     """
@@ -245,35 +630,187 @@ def plot_epsilon(distances, min_samples, height=5):
     plt.show()
 
     
-def silscore_dbscan(data, labels, clustered_bool):
+def silscore_dbscan(data, labels, clustered_bool, sample_size=None,
+                    random_state=None):
     """Generates sil score ommitting observations not assigned to any cluster by dbscan 
+
+    :param sample_size: integer or None, if set the silhouette score is
+                        estimated from a random sample of this many clustered
+                        observations rather than all of them (default None)
+    :param random_state: integer or None, seed used for the sample
     """
-    return silhouette_score(data[clustered_bool], labels[clustered_bool])
+    return silhouette_score(
+        data[clustered_bool], labels[clustered_bool],
+        sample_size=sample_size, random_state=random_state
+    )
 
 
-def fit_dbscan(data, min_samples, eps):
+def fit_dbscan(data, min_samples, eps, sil_sample_size=None,
+               random_state=109):
     """Fits dbscan and returns dictionary of results including model, labels, indices
+
+    :param sil_sample_size: integer or None, if set the silhouette score is
+                            estimated from a random sample of this many
+                            clustered observations, which avoids O(n^2)
+                            scoring on large datasets (default None)
+    :param random_state: integer, seed used for the silhouette sample
     """
     fitted_dbscan = DBSCAN(eps=eps, min_samples=min_samples).fit(data)
-    db_labels = fitted_dbscan.labels_
-    n_clusters = sum([i != -1 for i in set(db_labels)])
-    
+    return _dbscan_results_dict(
+        data, fitted_dbscan, sil_sample_size, random_state
+    )
+
+
+def _dbscan_results_dict(data, fitted_dbscan, sil_sample_size=None,
+                         random_state=109):
+    """Generates the fit_dbscan results dictionary for a fitted dbscan model
+
+    All bookkeeping uses numpy arrays. 'clustered_bool' and 'core_bool' are
+    boolean masks of length n, and 'cluster_counts' is a pd.Series of
+    observation counts per label (always including the -1 unclustered label)
+    sorted in descending order like pd.Series.value_counts().
+    """
+    db_labels = np.asarray(fitted_dbscan.labels_)
+    n_samples = len(db_labels)
+
+    # label counts offset by 1 so that the unclustered -1 label is at index 0
+    label_counts = np.bincount(db_labels + 1)
+    n_clusters = int(np.count_nonzero(label_counts[1:]))
+
+    cluster_counts = pd.Series(
+        label_counts, index=np.arange(-1, len(label_counts) - 1)
+    )
+    cluster_counts = cluster_counts[
+        (cluster_counts > 0) | (cluster_counts.index == -1)
+    ].sort_values(ascending=False, kind='stable')
+
     # generate boolean indices for observations assigned to clusters
-    clustered_bool = [i != -1 for i in db_labels]
-    
+    clustered_bool = db_labels != -1
+
+    core_bool = np.zeros(n_samples, dtype=bool)
+    core_bool[fitted_dbscan.core_sample_indices_] = True
+
+    # only sample the silhouette score if the clustered subset is larger
+    if sil_sample_size is not None \
+            and sil_sample_size >= clustered_bool.sum():
+        sil_sample_size = None
+
     dbscan_dict = {
         'model': fitted_dbscan,
         'n_clusters': n_clusters,
         'labels': db_labels,
         'core_sample_indices': fitted_dbscan.core_sample_indices_,
+        'core_bool': core_bool,
         'clustered_bool': clustered_bool,
-        'cluster_counts': pd.Series(db_labels).value_counts(),
-        'sil_score': silscore_dbscan(data, db_labels, clustered_bool)
-                     if n_clusters>1 else 0
+        'cluster_counts': cluster_counts,
+        'sil_score': silscore_dbscan(
+                         data, db_labels, clustered_bool,
+                         sil_sample_size, random_state
+                     ) if n_clusters>1 else 0
     }
     return dbscan_dict
 
 
+def _radius_neighbors_graph(data, radius):
+    """Returns a sparse csr distance graph of all neighbors within radius
+
+    Each observation is included as its own neighbor with a stored distance
+    of 0, consistent with how DBSCAN counts min_samples.
+    """
+    fitted_neighbors = NearestNeighbors(radius=radius).fit(data)
+    distances, indices = fitted_neighbors.radius_neighbors(data)
+    n_neighbors = np.array([len(i) for i in indices])
+    indptr = np.concatenate([[0], np.cumsum(n_neighbors)])
+
+    return csr_matrix(
+        (np.concatenate(distances), np.concatenate(indices), indptr),
+        shape=(len(indices), len(indices))
+    )
+
+
+def _dbscan_labels_from_graph(graph, eps, min_samples):
+    """Derives dbscan labels and core samples by thresholding a distance graph
+
+    Core points are connected into clusters using connected components of
+    the core-to-core neighbor graph, and each border point is assigned the
+    label of its nearest core point within eps.
+
+    :return: tuple, [0] np.array of labels with -1 for unclustered points,
+             [1] np.array of core sample indices
+    """
+    n_samples = graph.shape[0]
+
+    # threshold the graph at eps, keeping explicit 0 distance entries
+    within_eps = graph.copy()
+    within_eps.data = (within_eps.data <= eps).astype(np.int8)
+    within_eps.eliminate_zeros()
+
+    is_core = np.asarray(within_eps.sum(axis=1)).ravel() >= min_samples
+    core_sample_indices = np.flatnonzero(is_core)
+
+    labels = np.full(n_samples, -1, dtype=np.intp)
+    if len(core_sample_indices) == 0:
+        return labels, core_sample_indices
+
+    _, core_labels = connected_components(
+        within_eps[core_sample_indices][:, core_sample_indices],
+        directed=False
+    )
+    labels[core_sample_indices] = core_labels
+
+    # assign each border point to the cluster of its nearest core neighbor
+    border_graph = graph[~is_core][:, core_sample_indices].tocoo()
+    in_eps = border_graph.data <= eps
+    rows = border_graph.row[in_eps]
+    cols = border_graph.col[in_eps]
+    order = np.lexsort((border_graph.data[in_eps], rows))
+    rows, first = np.unique(rows[order], return_index=True)
+    labels[np.flatnonzero(~is_core)[rows]] = core_labels[cols[order][first]]
+
+    return labels, core_sample_indices
+
+
+def dbscan_grid(data, eps_list, min_samples_list, sil_sample_size=None,
+                random_state=109):
+    """Generates fit_dbscan results for every eps and min_samples combination
+
+    A single radius neighbors graph is built at the maximum eps value, and
+    each (eps, min_samples) setting is then derived by thresholding that
+    graph, which avoids refitting DBSCAN from the raw data for every trial.
+
+    :param data: np.array or dataframe, the data to cluster
+    :param eps_list: list of float eps values to evaluate
+    :param min_samples_list: list of integer min_samples values to evaluate
+    :param sil_sample_size: integer or None, passed to fit_dbscan() style
+                            silhouette sampling for each setting
+    :param random_state: integer, seed used for the silhouette sample
+
+    :return: dict keyed by (eps, min_samples) tuples, each value being a
+             dbscan_dict in the format returned by fit_dbscan(), so it can
+             be passed directly to print_dbscan_results()
+    """
+    data = np.asarray(data)
+    graph = _radius_neighbors_graph(data, max(eps_list))
+
+    dbscan_dicts = {}
+    for eps in eps_list:
+        for min_samples in min_samples_list:
+            labels, core_sample_indices = _dbscan_labels_from_graph(
+                graph, eps, min_samples
+            )
+            # store an unfitted DBSCAN object carrying the derived results
+            # so the dict matches the fit_dbscan() structure
+            dbscan_model = DBSCAN(eps=eps, min_samples=min_samples)
+            dbscan_model.labels_ = labels
+            dbscan_model.core_sample_indices_ = core_sample_indices
+
+            dbscan_dicts[(eps, min_samples)] = _dbscan_results_dict(
+                data, dbscan_model, sil_sample_size, random_state
+            )
+
+    return dbscan_dicts
+
+
 def print_dbscan_results(dbscan_dict):
     """Prints summary results of fitted dbscan_dict
     """
@@ -331,8 +868,146 @@ def print_dbscan_results(dbscan_dict):
         )
 
 
+def _merges_to_linkage(n_samples, merges):
+    """Converts unsorted merges between observations into scipy linkage data
+
+    Each merge is a (representative a, representative b, height) row where
+    the representatives are any observation index within the merged
+    clusters. Merges are sorted by height and relabeled with union-find in
+    the same way scipy labels its own nearest-neighbor chain output.
+    """
+    merges = merges[np.argsort(merges[:, 2], kind='stable')]
+
+    parent = np.arange(2 * n_samples - 1)
+    sizes = np.ones(2 * n_samples - 1, dtype=int)
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    linkage_data = np.empty((n_samples - 1, 4))
+    for i, (a, b, height) in enumerate(merges):
+        x, y = find(int(a)), find(int(b))
+        new_label = n_samples + i
+        parent[x] = parent[y] = new_label
+        sizes[new_label] = sizes[x] + sizes[y]
+        linkage_data[i] = [min(x, y), max(x, y), height, sizes[new_label]]
+
+    return linkage_data
+
+
+def _single_linkage_mst(data):
+    """Generates single linkage merges from a minimum spanning tree
+
+    Uses Prim's algorithm, computing one row of distances at a time, so
+    memory use is O(n) rather than O(n^2).
+    """
+    n_samples = len(data)
+    in_tree = np.zeros(n_samples, dtype=bool)
+    min_dist = np.full(n_samples, np.inf)
+    nearest = np.zeros(n_samples, dtype=int)
+
+    merges = np.empty((n_samples - 1, 3))
+    current = 0
+    for i in range(n_samples - 1):
+        in_tree[current] = True
+        dist = np.sqrt(((data - data[current]) ** 2).sum(axis=1))
+        closer = dist < min_dist
+        min_dist[closer] = dist[closer]
+        nearest[closer] = current
+        min_dist[in_tree] = np.inf
+
+        current = np.argmin(min_dist)
+        merges[i] = [nearest[current], current, min_dist[current]]
+
+    return merges
+
+
+def _ward_linkage_nn_chain(data):
+    """Generates ward linkage merges using the nearest-neighbor chain algorithm
+
+    Clusters are represented by their centroids and sizes, and the ward
+    distance between two clusters is computed directly from them, so memory
+    use is O(n) rather than O(n^2). Heights match scipy ward linkage on
+    euclidean distances.
+    """
+    n_samples = len(data)
+    centroids = np.array(data, dtype=np.float64)
+    sizes = np.ones(n_samples)
+    active = np.ones(n_samples, dtype=bool)
+
+    merges = np.empty((n_samples - 1, 3))
+    chain = []
+    for i in range(n_samples - 1):
+        if not chain:
+            chain.append(np.argmax(active))
+
+        while True:
+            a = chain[-1]
+            dist = np.sqrt(
+                2 * sizes[a] * sizes / (sizes[a] + sizes)
+                * ((centroids - centroids[a]) ** 2).sum(axis=1)
+            )
+            dist[a] = np.inf
+            dist[~active] = np.inf
+
+            b = np.argmin(dist)
+            # prefer the previous chain element on ties to avoid cycles
+            if len(chain) > 1 and dist[chain[-2]] <= dist[b]:
+                b = chain[-2]
+                break
+            chain.append(b)
+
+        chain = chain[:-2]
+        merges[i] = [a, b, dist[b]]
+
+        # merge cluster a into slot b
+        centroids[b] = (sizes[a] * centroids[a] + sizes[b] * centroids[b]) \
+                       / (sizes[a] + sizes[b])
+        sizes[b] += sizes[a]
+        active[a] = False
+
+    return merges
+
+
+def build_linkage(data, method='ward'):
+    """Generates hierarchical clustering linkage data with bounded memory
+
+    The 'single' and 'ward' methods are computed without any distance
+    matrix, using a minimum spanning tree or nearest-neighbor chain on the
+    data itself, which needs O(n) memory. All other scipy linkage methods
+    need the float64 condensed distance matrix from pdist, which scipy
+    copies while merging, so their peak memory is about twice n*(n-1)/2
+    float64 values.
+
+    :param data: np.array or dataframe, the observations to cluster using
+                 euclidean distance
+    :param method: string, any scipy.cluster.hierarchy.linkage method such
+                   as 'single', 'ward', 'complete', or 'average'
+                   (default 'ward')
+
+    :return: np.array linkage data in the format returned by
+             scipy.cluster.hierarchy.linkage, suitable for plot_dendrogram()
+    """
+    data = np.asarray(data, dtype=np.float64)
+    n_samples = len(data)
+
+    if method=='single':
+        return _merges_to_linkage(n_samples, _single_linkage_mst(data))
+
+    if method=='ward':
+        return _merges_to_linkage(n_samples, _ward_linkage_nn_chain(data))
+
+    return hac.linkage(pdist(data), method=method)
+
+
 def plot_dendrogram(linkage_data, method_name,
-                    yticks=16, ytick_interval=1, height=4.5):
+                    yticks=16, ytick_interval=1, height=4.5,
+                    truncate_p=None):
     """Plots a dendrogram given a set of input hierarchy linkage data
     
     :param linkage_data: np.array output from scipy.cluster.hierarchy, which
@@ -345,14 +1020,24 @@ def plot_dendrogram(linkage_data, method_name,
     :param ytick_interval: integer, the desired interval for the resulting
                            y ticks
     :param height: float, the desired height of the resulting plot
+    :param truncate_p: integer or None, if set only the last truncate_p
+                       merged clusters are drawn as leaves, which keeps
+                       rendering fast for linkage data on large datasets
+                       (default None draws all leaves)
     
     return: plots dendrogram, no objects are returned
     """
     
     plt.figure(figsize=(12, height))
 
+    if truncate_p is None:
+        truncate_kwargs = {}
+    else:
+        truncate_kwargs = {'truncate_mode': 'lastp', 'p': truncate_p}
+
     hac.dendrogram(
-        linkage_data, above_threshold_color='lightgray', orientation="top"
+        linkage_data, above_threshold_color='lightgray', orientation="top",
+        **truncate_kwargs
     )
 
     plt.title(
@@ -367,8 +1052,8 @@ def plot_dendrogram(linkage_data, method_name,
 
 
 # from dataclasses import dataclass
-import hdbscan
-import umap
+hdbscan = lazy_import('hdbscan')
+umap = lazy_import('umap')
 # from pickle import dump, load
 # import plotly.io as pio
 # import plotly.express as px
@@ -379,8 +1064,265 @@ import umap
 # pio.renderers.default = 'jupyterlab'
 
 
+def save_mapper_bundle(mapper_dict, path, min_buffer_bytes=1024):
+    """Saves a nested dict of fitted UMAP mappers as a lazily loadable bundle
+
+    Each mapper is pickled with protocol 5, with every large array buffer
+    (training embedding, graph, raw data, kNN index arrays, including those
+    nested inside sparse matrices and search index objects) written
+    out-of-band to its own .npy file. A manifest.json records the groups,
+    dimensions, and files, so load_mapper_bundle() can memory-map only the
+    mappers that are actually used.
+
+    :param mapper_dict: dict of dicts of fitted mappers, such as
+                        {'attributes': {'2D': mapper, ...},
+                         'description': {...}}
+    :param path: string, the bundle directory to create or overwrite
+    :param min_buffer_bytes: integer, arrays smaller than this are kept in
+                             the pickle itself rather than written as
+                             separate files (default 1024)
+
+    :return: nothing is returned, the bundle is written to path
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {'format_version': 1, 'mappers': {}}
+
+    for group, mappers in mapper_dict.items():
+        manifest['mappers'][group] = {}
+        for dimension, mapper in mappers.items():
+            name = '{}_{}'.format(group, dimension)
+            buffers = []
+
+            def buffer_callback(buffer):
+                # returning True keeps small buffers inside the pickle
+                if buffer.raw().nbytes < min_buffer_bytes:
+                    return True
+                buffers.append(buffer)
+                return False
+
+            with open(os.path.join(path, name + '.pkl'), 'wb') as f:
+                pickle.dump(
+                    mapper, f, protocol=5, buffer_callback=buffer_callback
+                )
+
+            buffer_files = []
+            for i, buffer in enumerate(buffers):
+                buffer_file = '{}_{:03d}.npy'.format(name, i)
+                np.save(
+                    os.path.join(path, buffer_file),
+                    np.frombuffer(buffer.raw(), dtype=np.uint8)
+                )
+                buffer_files.append(buffer_file)
+
+            manifest['mappers'][group][dimension] = {
+                'pickle': name + '.pkl',
+                'buffers': buffer_files,
+            }
+
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+class _LazyMapperGroup(Mapping):
+    """Read-only dict of mappers that are loaded on first access
+    """
+    def __init__(self, path, entries):
+        self.path = path
+        self.entries = entries
+        self.loaded = {}
+
+    def __getitem__(self, dimension):
+        if dimension not in self.loaded:
+            entry = self.entries[dimension]
+            # copy-on-write memory maps page in lazily and remain writable
+            # without modifying the files on disk
+            buffers = [
+                np.load(os.path.join(self.path, buffer_file), mmap_mode='c')
+                for buffer_file in entry['buffers']
+            ]
+            with open(os.path.join(self.path, entry['pickle']), 'rb') as f:
+                self.loaded[dimension] = pickle.load(f, buffers=buffers)
+        return self.loaded[dimension]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def load_mapper_bundle(path):
+    """Lazily loads a mapper bundle written by save_mapper_bundle()
+
+    Only the manifest is read at load time. Each mapper is unpickled the
+    first time it is accessed, with its arrays memory-mapped from disk, so
+    a UMAP_embedder using only specific dimensions never reads the others.
+
+    :param path: string, the bundle directory
+
+    :return: dict of read-only dict-like mapper groups, which can be passed
+             as the mapper_dict argument of UMAP_embedder()
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    return {
+        group: _LazyMapperGroup(path, entries)
+        for group, entries in manifest['mappers'].items()
+    }
+
+
+class HDBSCAN_predictor():
+    """Vectorized, batched equivalent of hdbscan.approximate_predict
+
+    The condensed tree lookups that hdbscan.approximate_predict performs
+    point by point (nearest mutual reachability neighbor, the neighbor's
+    parent cluster and lambda, and the walk up the cluster tree) are
+    precomputed once from the clusterer's prediction_data_ as flat arrays.
+    Each batch of new points is then answered with one KD-tree query and
+    vectorized array operations, returning the same labels and membership
+    probabilities as hdbscan.approximate_predict.
+
+    :param clusterer: fitted hdbscan.HDBSCAN object, fitted with
+                      prediction_data=True or after calling
+                      generate_prediction_data()
+    :param batch_size: integer, the maximum number of points queried at once,
+                       which bounds memory use for large inputs
+                       (default 10000)
+    """
+    def __init__(self, clusterer, batch_size=10000):
+        if clusterer.prediction_data_ is None:
+            raise ValueError(
+                'Clusterer does not have prediction data! Try fitting with '\
+                'prediction_data=True set, or run generate_prediction_data '\
+                'on the clusterer'
+            )
+        prediction_data = clusterer.prediction_data_
+
+        self.batch_size = batch_size
+        self.min_samples = clusterer.min_samples or clusterer.min_cluster_size
+        self.tree = prediction_data.tree
+        self.core_distances = prediction_data.core_distances
+        self.n_features = prediction_data.raw_data.shape[1]
+
+        raw_tree = clusterer.condensed_tree_._raw_tree
+        cluster_tree = prediction_data.cluster_tree
+        n_points = len(self.core_distances)
+        n_nodes = max(raw_tree['parent'].max(), raw_tree['child'].max()) + 1
+
+        # parent cluster and lambda at which each original point departs
+        is_point = raw_tree['child'] < n_points
+        self.point_parent = np.zeros(n_points, dtype=np.intp)
+        self.point_lambda = np.zeros(n_points)
+        self.point_parent[raw_tree['child'][is_point]] = \
+            raw_tree['parent'][is_point]
+        self.point_lambda[raw_tree['child'][is_point]] = \
+            raw_tree['lambda_val'][is_point]
+
+        # parent and lambda of each cluster node, used to walk up the tree
+        self.cluster_parent = np.arange(n_nodes, dtype=np.intp)
+        self.cluster_lambda = np.full(n_nodes, -np.inf)
+        self.cluster_parent[cluster_tree['child']] = cluster_tree['parent']
+        self.cluster_lambda[cluster_tree['child']] = cluster_tree['lambda_val']
+        self.tree_root = cluster_tree['parent'].min() \
+            if len(cluster_tree) else n_points
+
+        # selected cluster labels and max lambdas keyed by cluster node
+        self.cluster_label = np.full(n_nodes, -1, dtype=np.int32)
+        self.max_lambda = np.zeros(n_nodes)
+        for cluster, label in prediction_data.cluster_map.items():
+            self.cluster_label[cluster] = label
+        for cluster, max_lambda in prediction_data.max_lambdas.items():
+            self.max_lambda[cluster] = max_lambda
+
+    def _predict_batch(self, points):
+        """Predicts labels and probabilities for a single batch of points
+        """
+        min_samples = self.min_samples
+        neighbor_distances, neighbor_indices = self.tree.query(
+            points, k=2 * min_samples
+        )
+
+        # nearest neighbor by mutual reachability distance
+        mr_distances = np.maximum(
+            np.maximum(
+                self.core_distances[neighbor_indices],
+                neighbor_distances[:, [min_samples]]
+            ),
+            neighbor_distances
+        )
+        nn_index = mr_distances.argmin(axis=1)
+        rows = np.arange(len(points))
+        nearest_neighbor = neighbor_indices[rows, nn_index]
+        min_mr_distance = mr_distances[rows, nn_index]
+
+        with np.errstate(divide='ignore'):
+            lambdas = np.where(
+                min_mr_distance > 0.0,
+                1.0 / min_mr_distance,
+                np.finfo(np.double).max
+            )
+
+        # walk points up the cluster tree while their lambda is below the
+        # lambda at which their current cluster split from its parent
+        potential_cluster = self.point_parent[nearest_neighbor]
+        walking = self.point_lambda[nearest_neighbor] > lambdas
+        while walking.any():
+            walking &= (potential_cluster > self.tree_root) \
+                       & (self.cluster_lambda[potential_cluster] >= lambdas)
+            potential_cluster[walking] = \
+                self.cluster_parent[potential_cluster[walking]]
+
+        labels = self.cluster_label[potential_cluster]
+        max_lambdas = self.max_lambda[potential_cluster]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probabilities = np.where(
+                max_lambdas > 0.0,
+                np.minimum(max_lambdas, lambdas) / max_lambdas,
+                1.0
+            )
+        probabilities[labels < 0] = 0.0
+
+        return labels, probabilities
+
+    def predict(self, points):
+        """Predicts cluster labels and membership probabilities of new points
+
+        :param points: np.array or dataframe of shape (n, n_features) with
+                       the same features on which the clusterer was fit
+
+        :return: tuple, [0] np.array of int cluster labels with -1 for noise,
+                 [1] np.array of float membership probabilities
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.shape[1] != self.n_features:
+            raise ValueError('New points dimension does not match fit data!')
+
+        labels = np.empty(len(points), dtype=np.int32)
+        probabilities = np.empty(len(points), dtype=np.float64)
+        for start in range(0, len(points), self.batch_size):
+            stop = start + self.batch_size
+            labels[start:stop], probabilities[start:stop] = \
+                self._predict_batch(points[start:stop])
+
+        return labels, probabilities
+
+
 class UMAP_embedder():
-    def __init__(self, scaler, final_cols, mapper_dict, clusterer, bert_embedding):
+    """Used for UMAP embedding section of final report
+
+    The bert_embedding argument may be either a dataframe of 'PID' and
+    embedding columns or an embeddings.EmbeddingStore.
+
+    If parametric_dict is provided, it must mirror the structure of
+    mapper_dict (for instance {'attributes': {'2D': network, ...}}) with
+    networks such as inference.DenseNetwork trained by
+    autoencoder.fit_parametric_umap(), and these are used in place of the
+    UMAP mappers' transform() to embed new projects.
+    """
+    def __init__(self, scaler, final_cols, mapper_dict, clusterer, bert_embedding,
+                 parametric_dict=None):
         #self.initial_columns = columns
         self.initial_columns = [
             'PID', 'Project_Name', 'Description', 'Category', 'Borough',
@@ -413,7 +1355,18 @@ class UMAP_embedder():
         self.mapper_dict = mapper_dict
         self.clusterer = clusterer
         self.embedding = bert_embedding
+        self.predictor = None
+        self.parametric_dict = parametric_dict
         
+    def get_mappers(self, group, dimensions="all"):
+        """Returns the list of mappers (or parametric networks) to apply
+        """
+        mappers = self.mapper_dict[group] if self.parametric_dict is None \
+            else self.parametric_dict[group]
+        if dimensions == "all":
+            return list(mappers.values())
+        return [mappers[dimension] for dimension in dimensions]
+
     def get_mapping_attributes(self,df, return_extra=False, dimensions="all"):
         """
         if return extra = True, returns 3 objects:
@@ -438,12 +1391,7 @@ class UMAP_embedder():
         dummified_full = dummified.assign(**added_cols)
         dummified_full = dummified_full[self.final_cols]
         mapping_df_list =[]
-        mapper_list = self.mapper_dict[
-            "attributes"
-        ].values() if dimensions == "all" else [
-            self.mapper_dict["attributes"][dimension]
-            for dimension in dimensions
-        ]
+        mapper_list = self.get_mappers("attributes", dimensions)
 
         for mapper in mapper_list:
             mapping = mapper.transform(dummified_full)
@@ -466,17 +1414,15 @@ class UMAP_embedder():
        
     def get_mapping_description(self, df, dimensions= "all"):
         
-        merged = df[["PID"]].merge(
-            self.embedding, on = "PID", how="left"
-        ).drop(columns="PID")
+        if isinstance(self.embedding, EmbeddingStore):
+            merged = self.embedding.get_frame(df["PID"], missing="nan")
+        else:
+            merged = df[["PID"]].merge(
+                self.embedding, on = "PID", how="left"
+            ).drop(columns="PID")
         mapping_df_list =[merged]
         #mapping_columns = [list(self.embedding.columns.copy())]
-        mapper_list = self.mapper_dict[
-            "description"
-        ].values() if dimensions == "all" else [
-            self.mapper_dict["description"][dimension]
-            for dimension in dimensions
-        ]
+        mapper_list = self.get_mappers("description", dimensions)
         for mapper in mapper_list:
             mapping = mapper.transform(merged)
             mapping_df = pd.DataFrame(
@@ -509,7 +1455,10 @@ class UMAP_embedder():
     
     def get_clustering(self, attributes_2D_mapping):
         assert attributes_2D_mapping.shape[1] ==2
-        new_labels = hdbscan.approximate_predict(clusterer, attributes_2D_mapping)
+        # precompute prediction lookups on first use and reuse them
+        if self.predictor is None:
+            self.predictor = HDBSCAN_predictor(self.clusterer)
+        new_labels = self.predictor.predict(attributes_2D_mapping)
         return new_labels
 
 
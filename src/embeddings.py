@@ -0,0 +1,603 @@
+"""
+This module contains functions for generating BERT embeddings of project
+descriptions and storing them in a binary format
+
+PARAMETERS
+
+    bert_model = 'uncased_L-2_H-128_A-2'
+        sets the default pretrained BERT model used for embeddings
+
+    output_layer_num = 4
+        sets the default number of BERT output layers concatenated for each
+        embedding, matching notebook 03a
+
+FUNCTIONS
+
+    clean_description()
+        Formats a single project description for embedding in the same
+        manner as notebook 03a
+
+    embed_text()
+        Generates the BERT embedding of a single description, loading the
+        model once per process
+
+    description_hash()
+        Generates the content hash of a normalized description used as the
+        EmbeddingCache key
+
+    embed_descriptions()
+        Generates BERT embeddings for the description of each unique project
+        using deduplicated, length-sorted batches across worker processes,
+        optionally only for descriptions not already in an EmbeddingCache
+
+    save_embeddings()
+        Saves an embedding matrix as a contiguous float32 .npy file alongside
+        a .npy index of the corresponding PIDs
+
+    convert_embedding_csv()
+        Converts a legacy embeddings_<model>.csv file of comma-joined
+        embedding strings into the binary save_embeddings() format
+
+CLASSES
+
+    EmbeddingCache()
+        On-disk cache of embeddings keyed by model name and description
+        content hash, so that refreshes only embed new descriptions
+
+    EmbeddingStore()
+        Memory-mapped read access to embeddings saved by save_embeddings(),
+        with fast lookup of embedding rows by PID
+
+"""
+
+import os
+import re
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+bert_model = 'uncased_L-2_H-128_A-2'
+output_layer_num = 4
+
+# model objects loaded once in each worker process by _init_bert_worker()
+_worker_model = {}
+
+# model objects loaded once in this process by embed_text()
+_text_model = {}
+
+
+def clean_description(description):
+    """Formats a single project description for embedding
+
+    Missing descriptions are replaced with an underscore, and sentences are
+    stripped and joined into a single string, exactly as in notebook 03a.
+    """
+    if type(description) == float:
+        return '_'
+    desc = [x.strip() for x in description.split('.') if x != '']
+    return ' '.join(desc)
+
+
+def _load_bert(model_path, layer_num):
+    """Returns a dict of the pretrained BERT model, vocabulary and tokenizer
+    """
+    import json
+    from keras_bert import (
+        get_checkpoint_paths, load_trained_model_from_checkpoint,
+        load_vocabulary, Tokenizer
+    )
+
+    paths = get_checkpoint_paths(model_path)
+    with open(paths.config) as f:
+        max_len = json.load(f)['max_position_embeddings']
+    vocabs = load_vocabulary(paths.vocab)
+
+    return {
+        # seq_len=None builds the model with variable sequence lengths, so
+        # each batch is only padded to its own longest description
+        'model': load_trained_model_from_checkpoint(
+            paths.config, paths.checkpoint,
+            output_layer_num=layer_num, seq_len=None
+        ),
+        'truncating_model': None,
+        'paths': paths,
+        'max_len': max_len,
+        'vocabs': vocabs,
+        'tokenizer': Tokenizer(vocabs),
+        'settings': (model_path, layer_num),
+    }
+
+
+def _init_bert_worker(model_path, layer_num, n_threads):
+    """Loads the pretrained BERT model and vocabulary once per worker process
+    """
+    if _worker_model.get('settings') == (model_path, layer_num):
+        return
+
+    import tensorflow as tf
+    if n_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    _worker_model.update(_load_bert(model_path, layer_num))
+
+
+def _truncating_model(bert):
+    """Returns the model built with seq_len equal to the maximum position,
+    loading it on first use, which truncates longer descriptions exactly as
+    notebook 03a did
+    """
+    if bert['truncating_model'] is None:
+        from keras_bert import load_trained_model_from_checkpoint
+
+        paths = bert['paths']
+        bert['truncating_model'] = load_trained_model_from_checkpoint(
+            paths.config, paths.checkpoint,
+            output_layer_num=bert['settings'][1], seq_len=bert['max_len']
+        )
+    return bert['truncating_model']
+
+
+def _extract(bert, model, texts, batch_size):
+    """Returns the pooled embeddings of texts from a loaded keras_bert model
+    """
+    from keras_bert import extract_embeddings, POOL_NSP, POOL_MAX
+
+    return np.asarray(
+        extract_embeddings(
+            model, texts,
+            vocabs=bert['vocabs'],
+            poolings=[POOL_NSP, POOL_MAX],
+            batch_size=batch_size,
+        ),
+        dtype=np.float32
+    )
+
+
+def _embed_chunk(texts, batch_size, bert=None):
+    """Embeds a chunk of descriptions with a loaded model, by default the one
+    loaded in this worker process by _init_bert_worker()
+
+    The variable length model cannot embed descriptions with more wordpieces
+    than the model has positions, so those are embedded by the truncating
+    model instead.
+    """
+    if bert is None:
+        bert = _worker_model
+    tokenizer = bert['tokenizer']
+    too_long = np.array([
+        len(tokenizer.tokenize(text)) > bert['max_len'] for text in texts
+    ], dtype=bool)
+
+    if not too_long.any():
+        return _extract(bert, bert['model'], texts, batch_size)
+
+    texts = np.array(texts, dtype=object)
+    truncated = _extract(
+        bert, _truncating_model(bert), list(texts[too_long]), batch_size
+    )
+    embeddings = np.empty((len(texts), truncated.shape[1]), dtype=np.float32)
+    embeddings[too_long] = truncated
+    if not too_long.all():
+        embeddings[~too_long] = _extract(
+            bert, bert['model'], list(texts[~too_long]), batch_size
+        )
+    return embeddings
+
+
+def embed_text(text, model_path, layer_num=output_layer_num):
+    """Generates the BERT embedding of a single description
+
+    The text is cleaned with clean_description() and embedded with the same
+    model and pooling as embed_descriptions(). The model, vocabulary and
+    tokenizer are loaded on the first call and cached for repeated calls
+    with the same model_path and layer_num.
+
+    :param text: string, the description to embed
+    :param model_path: string, path to the pretrained BERT directory, such
+                       as 'pretrained_bert/uncased_L-2_H-128_A-2'
+    :param layer_num: integer, the number of BERT output layers
+                      concatenated (default 4)
+
+    :return: 1D float32 np.array, the embedding
+    """
+    if _text_model.get('settings') != (model_path, layer_num):
+        _text_model.clear()
+        _text_model.update(_load_bert(model_path, layer_num))
+    return _embed_chunk([clean_description(text)], 1, _text_model)[0]
+
+
+def _token_lengths(texts, model_path):
+    """Returns the number of wordpiece tokens in each text
+    """
+    from keras_bert import get_checkpoint_paths, load_vocabulary, Tokenizer
+
+    paths = get_checkpoint_paths(model_path)
+    tokenizer = Tokenizer(load_vocabulary(paths.vocab))
+    return np.array([len(tokenizer.tokenize(text)) for text in texts])
+
+
+def description_hash(text):
+    """Generates the content hash of a normalized description
+
+    Descriptions are cleaned with clean_description(), lowercased (the
+    default BERT model is uncased), and whitespace is collapsed, so that
+    descriptions that embed identically share the same hash.
+
+    :return: bytes, the 20 byte sha1 digest
+    """
+    text = clean_description(text)
+    text = re.sub(r'\s+', ' ', text.lower()).strip()
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+def _embed_texts(texts, model_path, batch_size, n_workers, chunk_size,
+                 layer_num):
+    """Embeds a list of unique texts and returns embeddings in the same order
+    """
+    order = np.argsort(_token_lengths(texts, model_path), kind='stable')
+    sorted_texts = [texts[i] for i in order]
+    chunks = [
+        sorted_texts[start:start + chunk_size]
+        for start in range(0, len(sorted_texts), chunk_size)
+    ]
+
+    n_workers = n_workers or os.cpu_count()
+    n_threads = max(os.cpu_count() // n_workers, 1)
+
+    if n_workers == 1:
+        _init_bert_worker(model_path, layer_num, None)
+        results = [_embed_chunk(chunk, batch_size) for chunk in chunks]
+    else:
+        # spawn fresh workers, tensorflow state initialized in this process
+        # (thread settings or a loaded model) cannot be reused after a fork
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_bert_worker,
+            initargs=(model_path, layer_num, n_threads),
+        ) as executor:
+            results = list(
+                executor.map(_embed_chunk, chunks, [batch_size]*len(chunks))
+            )
+
+    sorted_embeddings = np.vstack(results)
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+
+def embed_descriptions(data, model_path, output_path=None, batch_size=64,
+                       n_workers=None, chunk_size=2048,
+                       layer_num=output_layer_num, cache=None):
+    """Generates BERT embeddings for the description of each unique project
+
+    Only the first description of each PID is embedded, as in notebook 03a.
+    Identical cleaned descriptions are embedded once and shared by all of
+    their PIDs, descriptions are sorted by token length so that each batch
+    needs minimal padding, and chunks of consecutive sorted descriptions
+    are embedded in parallel by worker processes that each load the model
+    once. Each worker limits tensorflow to its share of the CPU cores.
+
+    If an EmbeddingCache is provided, only descriptions whose content hash
+    is not already cached are run through BERT, the rest are joined from the
+    cache, and the cache is updated and saved.
+
+    :param data: pd.DataFrame containing 'PID' and 'Description' columns
+    :param model_path: string, path to the pretrained BERT directory, such
+                       as 'pretrained_bert/uncased_L-2_H-128_A-2'
+    :param output_path: string or None, if set the results are saved with
+                        save_embeddings() using this path prefix
+    :param batch_size: integer, the number of descriptions per inference
+                       batch (default 64)
+    :param n_workers: integer or None, the number of worker processes, None
+                      uses all available cores and 1 embeds everything in
+                      the current process
+    :param chunk_size: integer, the number of sorted descriptions sent to a
+                       worker at once (default 2048)
+    :param layer_num: integer, the number of BERT output layers
+                      concatenated, passed to keras_bert output_layer_num
+                      (default 4)
+    :param cache: EmbeddingCache or None, a cache for the same model_path
+                  and layer_num (default None embeds every description)
+
+    :return: tuple, [0] np.array of PIDs, [1] float32 np.array of embeddings
+             with one row per PID
+    """
+    projects = data[['PID', 'Description']].drop_duplicates(subset='PID')
+    pids = projects['PID'].values
+    texts = projects['Description'].apply(clean_description).values
+
+    # embed each unique text only once
+    unique_texts, text_index = np.unique(texts, return_inverse=True)
+
+    if cache is None:
+        unique_embeddings = _embed_texts(
+            list(unique_texts), model_path, batch_size, n_workers,
+            chunk_size, layer_num
+        )
+    else:
+        keys = [description_hash(text) for text in unique_texts]
+        found, unique_embeddings = cache.lookup(keys)
+        if not found.all():
+            new_embeddings = _embed_texts(
+                list(unique_texts[~found]), model_path, batch_size,
+                n_workers, chunk_size, layer_num
+            )
+            cache.add(np.array(keys)[~found], new_embeddings)
+            if unique_embeddings is None:
+                unique_embeddings = new_embeddings
+            else:
+                unique_embeddings[~found] = new_embeddings
+        cache.save()
+
+    embeddings = unique_embeddings[text_index.ravel()]
+
+    if output_path is not None:
+        save_embeddings(output_path, pids, embeddings)
+
+    return pids, embeddings
+
+
+def save_embeddings(path, pids, embeddings):
+    """Saves embeddings as a float32 .npy matrix with a .npy index of PIDs
+
+    Two files are written, '<path>.npy' containing the contiguous float32
+    embedding matrix with one row per PID, and '<path>_pids.npy' containing
+    the PIDs in the same row order.
+
+    :param path: string, the file path prefix, such as
+                 '../data/processed/embeddings_uncased_L-2_H-128_A-2'
+    :param pids: array-like of PIDs
+    :param embeddings: 2D array-like of embeddings, one row per PID
+
+    :return: nothing is returned, the files are written to disk
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    pids = np.asarray(pids)
+    if len(pids) != len(embeddings):
+        raise ValueError(
+            'pids has length {}, but embeddings has {} rows'\
+            ''.format(len(pids), len(embeddings))
+        )
+    np.save('{}.npy'.format(path), embeddings)
+    np.save('{}_pids.npy'.format(path), pids)
+
+
+def convert_embedding_csv(csv_path, output_path):
+    """Converts a legacy embeddings CSV file into the binary embedding format
+
+    The CSV files written by notebook 03a store each embedding as a single
+    comma-separated string in an 'embedding' column. This parses them once
+    and saves them with save_embeddings(), keeping the first row of any
+    duplicated PID as in notebook 03b.
+
+    :param csv_path: string, path to the 'PID', 'embedding' csv file
+    :param output_path: string, the path prefix passed to save_embeddings()
+
+    :return: nothing is returned, the files are written to disk
+    """
+    data_embed = pd.read_csv(csv_path).drop_duplicates(
+        subset='PID', keep='first'
+    )
+    embeddings = np.array(
+        data_embed['embedding'].str.split(',').tolist(), dtype=np.float32
+    )
+    save_embeddings(output_path, data_embed['PID'].values, embeddings)
+
+
+class EmbeddingCache():
+    """On-disk embedding cache keyed by model name and description hash
+
+    Entries are stored in the cache directory as a single
+    '<model_name>_cache.npz' file holding the float32 'embeddings', the
+    description_hash() digests 'keys', and 'last_used' (the unix time each
+    entry was last looked up or added), so each model has its own cache and
+    the three arrays are always replaced together.
+
+    :param path: string, the cache directory, created if it does not exist
+    :param model_name: string, identifies the model and settings that
+                       generated the embeddings, such as
+                       'uncased_L-2_H-128_A-2_4layers' (default bert_model)
+    """
+    def __init__(self, path, model_name=bert_model):
+        self.path = path
+        self.model_name = model_name
+        os.makedirs(path, exist_ok=True)
+
+        cache_path = self._cache_path()
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as arrays:
+                self.embeddings = arrays['embeddings']
+                self.keys = arrays['keys']
+                self.last_used = arrays['last_used']
+            if not len(self.embeddings)==len(self.keys)==len(self.last_used):
+                raise ValueError(
+                    'The cache file {} is inconsistent, it has {} '\
+                    'embeddings, {} keys, and {} last used times'.format(
+                        cache_path, len(self.embeddings), len(self.keys),
+                        len(self.last_used)
+                    )
+                )
+        else:
+            self.embeddings = None
+            self.keys = np.array([], dtype='S20')
+            self.last_used = np.array([], dtype=np.float64)
+        self.index = pd.Index(self.keys)
+
+    def _cache_path(self):
+        return os.path.join(self.path, '{}_cache.npz'.format(self.model_name))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Looks up cached embeddings for a list of description hashes
+
+        :param keys: list of description_hash() digests
+
+        :return: tuple, [0] boolean np.array indicating which keys were
+                 found, [1] float32 np.array with one row per key, where rows
+                 for keys not found are NaN (None if the cache is empty)
+        """
+        if self.embeddings is None:
+            return np.zeros(len(keys), dtype=bool), None
+
+        positions = self.index.get_indexer(np.array(keys, dtype='S20'))
+        found = positions != -1
+
+        embeddings = np.full(
+            (len(keys), self.embeddings.shape[1]), np.nan, dtype=np.float32
+        )
+        embeddings[found] = self.embeddings[positions[found]]
+        self.last_used[positions[found]] = time.time()
+
+        return found, embeddings
+
+    def add(self, keys, embeddings):
+        """Adds embeddings for description hashes not already in the cache
+        """
+        keys = np.array(keys, dtype='S20')
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        # keep the first occurrence of each key not already cached
+        _, first = np.unique(keys, return_index=True)
+        new = np.zeros(len(keys), dtype=bool)
+        new[first] = True
+        new &= ~pd.Index(keys).isin(self.keys)
+        keys, embeddings = keys[new], embeddings[new]
+
+        if self.embeddings is None:
+            self.embeddings = embeddings
+        elif embeddings.shape[1] != self.embeddings.shape[1]:
+            raise ValueError(
+                'Embeddings of dimension {} cannot be added to a cache of '\
+                'dimension {}'.format(
+                    embeddings.shape[1], self.embeddings.shape[1]
+                )
+            )
+        else:
+            self.embeddings = np.vstack([self.embeddings, embeddings])
+
+        self.keys = np.concatenate([self.keys, keys])
+        self.last_used = np.concatenate(
+            [self.last_used, np.full(len(keys), time.time())]
+        )
+        self.index = pd.Index(self.keys)
+
+    def evict(self, keep_keys=None, max_age_days=None):
+        """Removes stale entries from the cache
+
+        :param keep_keys: None or list of description hashes, if set all
+                          entries not in this list are removed, for example
+                          the hashes of every current project description
+        :param max_age_days: None or float, if set entries not used within
+                             this many days are removed
+
+        :return: integer, the number of entries removed
+        """
+        keep = np.ones(len(self.keys), dtype=bool)
+        if keep_keys is not None:
+            keep &= self.index.isin(np.array(keep_keys, dtype='S20'))
+        if max_age_days is not None:
+            keep &= self.last_used >= time.time() - max_age_days * 86400
+
+        n_removed = int((~keep).sum())
+        if n_removed:
+            self.embeddings = self.embeddings[keep]
+            self.keys = self.keys[keep]
+            self.last_used = self.last_used[keep]
+            self.index = pd.Index(self.keys)
+
+        return n_removed
+
+    def save(self):
+        """Writes the cache to disk as one file, replaced atomically
+        """
+        if self.embeddings is None:
+            return
+
+        cache_path = self._cache_path()
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, embeddings=self.embeddings, keys=self.keys,
+                last_used=self.last_used
+            )
+        os.replace(tmp_path, cache_path)
+
+
+class EmbeddingStore():
+    """Memory-mapped read access to embeddings saved by save_embeddings()
+
+    The float32 matrix is opened with np.load(mmap_mode='r'), so loading is
+    near-instant and only the rows that are used are read from disk.
+
+    :param path: string, the path prefix passed to save_embeddings()
+    :param column_prefix: string, prefix of the column names used by
+                          get_frame() (default 'descr_embed')
+    """
+    def __init__(self, path, column_prefix='descr_embed'):
+        self.embeddings = np.load('{}.npy'.format(path), mmap_mode='r')
+        self.pids = np.load('{}_pids.npy'.format(path))
+        self.index = pd.Index(self.pids)
+        self.columns = [
+            '{}_{}'.format(column_prefix, i+1)
+            for i in range(self.embeddings.shape[1])
+        ]
+
+    def __len__(self):
+        return len(self.pids)
+
+    @property
+    def shape(self):
+        return self.embeddings.shape
+
+    def get(self, pids, missing='raise'):
+        """Returns the embedding rows for a list of PIDs
+
+        If the requested PIDs are stored as one contiguous block in the same
+        order, a read-only view of the memory-mapped matrix is returned
+        without copying, otherwise only the requested rows are read.
+
+        :param pids: array-like of PIDs
+        :param missing: string, either 'raise' to raise a KeyError for PIDs
+                        not in the store, or 'nan' to return rows of NaN
+                        values for them (default 'raise')
+
+        :return: float32 np.array of shape (len(pids), embedding dimension)
+        """
+        positions = self.index.get_indexer(np.asarray(pids))
+        not_found = positions == -1
+
+        if not_found.any():
+            if missing == 'raise':
+                raise KeyError(
+                    '{} PIDs not found in embedding store, for example {}'\
+                    ''.format(
+                        not_found.sum(), np.asarray(pids)[not_found][:5]
+                    )
+                )
+            embeddings = np.full(
+                (len(positions), self.embeddings.shape[1]), np.nan,
+                dtype=np.float32
+            )
+            embeddings[~not_found] = self.embeddings[positions[~not_found]]
+            return embeddings
+
+        if len(positions) and np.array_equal(
+            positions, np.arange(positions[0], positions[0] + len(positions))
+        ):
+            return self.embeddings[positions[0]:positions[0] + len(positions)]
+
+        return self.embeddings[positions]
+
+    def get_frame(self, pids, missing='raise'):
+        """Returns get() embeddings as a dataframe with one column per value
+        """
+        return pd.DataFrame(self.get(pids, missing), columns=self.columns)
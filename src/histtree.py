@@ -0,0 +1,370 @@
+"""
+This module contains a uint8 pre-binning stage for the attributes used in
+the decision tree experiments, and a histogram-based decision tree learner
+that fits directly on the pre-binned columns
+
+FUNCTIONS
+
+    bin_column()
+        Returns the bin edges of one training column
+
+CLASSES
+
+    FeatureBins()
+        Bins every candidate attribute of the train and test data once into
+        a column-major uint8 matrix (1/8 the memory of float64), from which
+        the columns of any attribute subset can be selected
+
+    HistTree()
+        Level-wise histogram decision tree for regression or binary (also
+        multi-output) classification on uint8 binned features, which is grown
+        once to its maximum depth and can predict at any shallower depth
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def bin_column(values, max_bins=256):
+    """Returns the bin edges of one training column
+
+    Columns with at most max_bins distinct values (dummies, counts, or small
+    datasets) get one bin per distinct value, so every threshold between
+    distinct values remains available.
+    Other columns are split at max_bins - 1 quantiles.
+
+    :param values: 1D np.array, the training values of the column
+    :param max_bins: integer <=256, the maximum number of bins (default 256)
+
+    :return: 1D np.array of increasing edges, a value x is placed in bin
+             np.searchsorted(edges, x, side='right')
+    """
+    distinct = np.unique(values[~np.isnan(values)])
+    if len(distinct) <= max_bins:
+        return (distinct[:-1] + distinct[1:])/2
+    quantiles = np.quantile(distinct, np.linspace(0, 1, max_bins + 1)[1:-1])
+    return np.unique(quantiles)
+
+
+class FeatureBins():
+    """Pre-binned uint8 train and test matrices of the candidate attributes
+
+    Bin edges are computed on the training data only and applied to both
+    the train and test data. Columns binned by quantiles can only be split
+    at the bin edges, so trees fit on the bins approximate, rather than
+    reproduce, trees fit on the raw columns.
+
+    :param data_train: dataframe, the training data
+    :param data_test: dataframe, the test data, with the same columns
+    :param columns: None or list of strings, the columns to bin (default None
+                    bins every numeric or boolean column of data_train)
+    :param max_bins: integer <=256, the maximum number of bins per column
+                     (default 256)
+    """
+    def __init__(self, data_train, data_test, columns=None, max_bins=256):
+        if not 2 <= max_bins <= 256:
+            raise ValueError('max_bins must be between 2 and 256')
+        if columns is None:
+            columns = list(
+                data_train.select_dtypes(include=[np.number, 'bool']).columns
+            )
+        self.columns = list(columns)
+        self.max_bins = max_bins
+        self._positions = {c: i for i, c in enumerate(self.columns)}
+
+        self.bin_edges = {}
+        self.X_train = np.empty(
+            (len(data_train), len(self.columns)), dtype=np.uint8, order='F'
+        )
+        self.X_test = np.empty(
+            (len(data_test), len(self.columns)), dtype=np.uint8, order='F'
+        )
+        for i, column in enumerate(self.columns):
+            train_values = data_train[column].values.astype(np.float64)
+            edges = bin_column(train_values, max_bins)
+            self.bin_edges[column] = edges
+            self.X_train[:, i] = np.searchsorted(
+                edges, train_values, side='right'
+            )
+            self.X_test[:, i] = np.searchsorted(
+                edges, data_test[column].values.astype(np.float64),
+                side='right'
+            )
+
+    def get(self, attributes):
+        """Returns the binned train and test matrices of a list of columns
+
+        :param attributes: list of strings, column names, for instance as
+                           returned by trees.expand_attributes()
+
+        :return: tuple of 2D uint8 np.arrays, [0] train, [1] test matrix
+        """
+        missing = [a for a in attributes if a not in self._positions]
+        if missing:
+            raise KeyError('The columns {} were not binned'.format(missing))
+        positions = [self._positions[a] for a in attributes]
+        return self.X_train[:, positions], self.X_test[:, positions]
+
+    def get_frames(self, attributes):
+        """Returns the binned train and test dataframes of a list of columns
+        """
+        X_tr, X_te = self.get(attributes)
+        return (
+            pd.DataFrame(X_tr, columns=attributes),
+            pd.DataFrame(X_te, columns=attributes),
+        )
+
+
+class HistTree():
+    """Level-wise histogram decision tree on uint8 binned features
+
+    At each depth, one pass per feature accumulates the sample count and
+    response sums of every (node, bin) pair with np.bincount, and every node
+    is split at the bin threshold that most reduces the summed squared error
+    of the responses. For 0/1 responses this is also the split that most
+    reduces the Gini impurity, so the same learner serves regression and
+    binary (including multi-output) classification, and split finding costs
+    O(bins) per node and feature rather than a sort of the feature values.
+
+    Because each split only depends on the samples in its node, the depth d
+    tree is the first d levels of any deeper tree, so a tree fit once with
+    max_depth=20 predicts as each of the depth 1 to 20 trees with
+    predict(X, depth=d), or with the model returned by truncate(d).
+
+    Splits with equal error reductions are broken by the first feature and
+    lowest bin, which need not be the split sklearn picks, so the trees and
+    their scores can differ from sklearn trees even on unbinned data.
+
+    :param max_depth: integer, the maximum depth grown (default 20)
+    :param classification: boolean, whether predict() returns 0/1 class
+                           labels, in which case the responses must be 0 or 1
+                           (default False)
+    :param min_samples_leaf: integer, the minimum number of samples in each
+                             leaf (default 1)
+    :param min_samples_split: integer, the minimum number of samples needed
+                              to split a node (default 2)
+    """
+    def __init__(self, max_depth=20, classification=False,
+                 min_samples_leaf=1, min_samples_split=2):
+        self.max_depth = max_depth
+        self.classification = classification
+        self.min_samples_leaf = min_samples_leaf
+        self.min_samples_split = min_samples_split
+        self.depth_limit = max_depth
+
+    def fit(self, X, y):
+        """Grows the tree on binned features X and responses y
+
+        :param X: 2D uint8 np.array or dataframe of binned features, for
+                  instance from FeatureBins.get()
+        :param y: 1D or 2D np.array or pandas object of responses
+
+        :return: self
+        """
+        X = np.asarray(X)
+        if X.dtype!=np.uint8:
+            raise ValueError(
+                'HistTree requires uint8 binned features, see FeatureBins'
+            )
+        y = np.asarray(y, dtype=np.float64)
+        self._single_output = y.ndim==1
+        if self._single_output:
+            y = y[:, None]
+        n_rows, n_features = X.shape
+        n_bins = int(X.max()) + 1 if X.size else 1
+
+        # node arrays, grown one level at a time
+        feature = np.array([-1])
+        threshold = np.array([0], dtype=np.int64)
+        children = np.array([[-1, -1]])
+        value = y.mean(axis=0)[None, :]
+
+        node_of_row = np.zeros(n_rows, dtype=np.int64)
+        active = np.array([0])
+        for depth in range(self.max_depth):
+            if len(active)==0:
+                break
+            n_active = len(active)
+
+            # positions of the active nodes, and the rows within them
+            local = np.full(len(feature), -1)
+            local[active] = np.arange(n_active)
+            rows = np.nonzero(local[node_of_row] >= 0)[0]
+            row_node = local[node_of_row[rows]]
+            y_rows = y[rows]
+
+            node_count = np.bincount(row_node, minlength=n_active)
+            node_sum = np.stack([
+                np.bincount(row_node, weights=col, minlength=n_active)
+                for col in y_rows.T
+            ], axis=1)
+            node_sq_sum = np.bincount(
+                row_node, weights=(y_rows**2).sum(axis=1), minlength=n_active
+            )
+            node_sse = node_sq_sum - (node_sum**2).sum(axis=1)/node_count
+
+            best_score = np.full(n_active, -np.inf)
+            best_feature = np.zeros(n_active, dtype=np.int64)
+            best_threshold = np.zeros(n_active, dtype=np.int64)
+            for f in range(n_features):
+                key = row_node*n_bins + X[rows, f]
+                left_count = np.bincount(
+                    key, minlength=n_active*n_bins
+                ).reshape(n_active, n_bins).cumsum(axis=1)
+                right_count = node_count[:, None] - left_count
+
+                score = np.zeros((n_active, n_bins))
+                for o, col in enumerate(y_rows.T):
+                    left_sum = np.bincount(
+                        key, weights=col, minlength=n_active*n_bins
+                    ).reshape(n_active, n_bins).cumsum(axis=1)
+                    right_sum = node_sum[:, o, None] - left_sum
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        score += left_sum**2/left_count \
+                            + right_sum**2/right_count
+
+                score[
+                    (left_count < self.min_samples_leaf) \
+                    | (right_count < self.min_samples_leaf)
+                ] = -np.inf
+                f_threshold = score.argmax(axis=1)
+                f_score = score[np.arange(n_active), f_threshold]
+                better = f_score > best_score
+                best_score[better] = f_score[better]
+                best_feature[better] = f
+                best_threshold[better] = f_threshold[better]
+
+            split = np.isfinite(best_score) \
+                & (node_count >= self.min_samples_split) \
+                & (node_sse > 1e-12*np.maximum(node_sq_sum, 1))
+            if not split.any():
+                break
+
+            # add two children to every split node
+            split_nodes = active[split]
+            n_nodes = len(feature)
+            left_ids = n_nodes + 2*np.arange(len(split_nodes))
+            feature = np.concatenate([feature, np.full(2*len(left_ids), -1)])
+            threshold = np.concatenate(
+                [threshold, np.zeros(2*len(left_ids), dtype=np.int64)]
+            )
+            children = np.concatenate(
+                [children, np.full((2*len(left_ids), 2), -1)]
+            )
+            feature[split_nodes] = best_feature[split]
+            threshold[split_nodes] = best_threshold[split]
+            children[split_nodes, 0] = left_ids
+            children[split_nodes, 1] = left_ids + 1
+
+            # move the rows of split nodes to their children
+            moving = rows[split[row_node]]
+            parent = node_of_row[moving]
+            go_right = X[moving, feature[parent]] > threshold[parent]
+            node_of_row[moving] = children[parent, go_right.astype(np.int64)]
+
+            child_ids = np.arange(n_nodes, len(feature))
+            child_count = np.bincount(
+                node_of_row[moving] - n_nodes, minlength=len(child_ids)
+            )
+            child_value = np.stack([
+                np.bincount(
+                    node_of_row[moving] - n_nodes, weights=col,
+                    minlength=len(child_ids)
+                ) for col in y[moving].T
+            ], axis=1)/child_count[:, None]
+            value = np.concatenate([value, child_value])
+
+            active = child_ids
+
+        self.feature_ = feature
+        self.threshold_ = threshold
+        self.children_ = children
+        self.value_ = value
+        self.n_features_ = n_features
+        self.depth_limit = self.max_depth
+        return self
+
+    def truncate(self, depth):
+        """Returns a copy of the fitted tree that predicts at a lower depth
+
+        The copy shares the node arrays of this tree.
+
+        :param depth: integer, the maximum depth used for predictions
+
+        :return: HistTree object
+        """
+        tree = HistTree(
+            self.max_depth, self.classification, self.min_samples_leaf,
+            self.min_samples_split
+        )
+        tree.__dict__.update(self.__dict__)
+        tree.depth_limit = min(depth, self.max_depth)
+        return tree
+
+    def get_depth(self):
+        """Returns the depth of the tree used for predictions
+        """
+        depth = 0
+        nodes = np.array([0])
+        while depth < self.depth_limit:
+            nodes = self.children_[nodes][self.feature_[nodes] >= 0].ravel()
+            if len(nodes)==0:
+                break
+            depth += 1
+        return depth
+
+    def predict_value(self, X, depth=None):
+        """Returns the mean training response of the node reached by each row
+
+        :param X: 2D uint8 np.array or dataframe of binned features
+        :param depth: None or integer, the maximum depth descended
+                      (default None uses depth_limit)
+
+        :return: 2D np.array of shape (n, n_outputs)
+        """
+        X = np.asarray(X)
+        depth = self.depth_limit if depth is None else depth
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int64)
+        for _ in range(depth):
+            internal = self.feature_[node] >= 0
+            if not internal.any():
+                break
+            at = node[internal]
+            go_right = X[rows[internal], self.feature_[at]] \
+                > self.threshold_[at]
+            node[internal] = self.children_[at, go_right.astype(np.int64)]
+        return self.value_[node]
+
+    def predict(self, X, depth=None):
+        """Predicts responses, or 0/1 class labels if classification=True
+
+        :param X: 2D uint8 np.array or dataframe of binned features
+        :param depth: None or integer, the maximum depth descended
+                      (default None uses depth_limit)
+
+        :return: 1D np.array, or 2D np.array for multi-output responses
+        """
+        prediction = self.predict_value(X, depth)
+        if self.classification:
+            prediction = (prediction > 0.5).astype(np.int64)
+        return prediction[:, 0] if self._single_output else prediction
+
+    def score(self, X, y, depth=None):
+        """Returns the accuracy (classification) or R^2 (regression) of
+        predict(X, depth) on y, averaged over outputs like sklearn's score()
+        """
+        y = np.asarray(y)
+        prediction = self.predict(X, depth)
+        if self.classification:
+            if y.ndim==1:
+                return float(np.mean(prediction==y))
+            return float(np.mean((prediction==y).all(axis=1)))
+        y = y.astype(np.float64).reshape(len(y), -1)
+        prediction = prediction.reshape(len(y), -1)
+        residual = ((y - prediction)**2).sum(axis=0)
+        total = ((y - y.mean(axis=0))**2).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2 = np.where(total > 0, 1 - residual/total, 0.0)
+        return float(r2.mean())
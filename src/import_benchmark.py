@@ -0,0 +1,118 @@
+"""
+This module contains an import-time benchmark for the src package, used to
+check that the lightweight modules stay fast to import now that heavy
+dependencies are loaded lazily (see src/lazy.py)
+
+Run it from the project root with:
+
+    python -m src.import_benchmark
+
+The command exits with status 1 if any of the budgeted modules takes longer
+than its budget to import.
+
+PARAMETERS
+
+    import_budgets = {'src.datagen': 1.0, 'src.scale': 1.0}
+        Maximum import time, in seconds, of each budgeted module
+
+    benchmark_modules
+        List of all src modules timed and reported by main()
+
+FUNCTIONS
+
+    time_import()
+        Returns the median wall-clock time of importing a module in fresh
+        python interpreters
+
+    main()
+        Times every module in benchmark_modules, prints a report, and returns
+        a nonzero exit status if any budget is exceeded
+
+"""
+
+import subprocess
+import sys
+
+
+import_budgets = {
+    'src.datagen': 1.0,
+    'src.scale': 1.0,
+}
+
+benchmark_modules = [
+    'src.datagen',
+    'src.scale',
+    'src.model',
+    'src.visualize',
+    'src.trees',
+    'src.embeddings',
+    'src.inference',
+    'src.similarity',
+    'src.cluster',
+    'src.autoencoder',
+]
+
+_timing_code = (
+    "import time; t = time.perf_counter(); import {}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def time_import(module_name, repeats=3):
+    """Returns the median time of importing a module in fresh interpreters
+
+    Each repeat runs in a new python subprocess so that nothing is already
+    cached in sys.modules. Interpreter startup itself is not included.
+
+    :param module_name: string, the full name of the module to import
+    :param repeats: integer, the number of fresh imports to time (default 3)
+
+    :return: float, the median import time in seconds, or None if the module
+             fails to import (e.g. a dependency is not installed)
+    """
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-c', _timing_code.format(module_name)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return sorted(times)[len(times)//2]
+
+
+def main(repeats=3):
+    """Times the src modules, prints a report, and checks import_budgets
+
+    :param repeats: integer, the number of fresh imports timed per module
+                    (default 3)
+
+    :return: integer, 0 if every budgeted module imports within its budget,
+             otherwise 1
+    """
+    status = 0
+    for module_name in benchmark_modules:
+        import_time = time_import(module_name, repeats)
+        budget = import_budgets.get(module_name)
+        if import_time is None:
+            result = 'import failed'
+            if budget is not None:
+                status = 1
+        else:
+            result = '{:.3f}s'.format(import_time)
+            if budget is not None:
+                within = import_time <= budget
+                result += '  (budget {:.1f}s: {})'.format(
+                    budget, 'ok' if within else 'EXCEEDED'
+                )
+                if not within:
+                    status = 1
+        print('{:<18} {}'.format(module_name, result))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+This module contains dependency-free numpy inference for dense networks
+trained with tensorflow.keras, so that fitted networks can be used for fast
+batch predictions in processes that never import tensorflow, and an int8
+quantized TFLite runtime for high-volume encoding
+
+FUNCTIONS
+
+    export_dense_npz()
+        Writes the Dense layer weights, biases, and activations of a fitted
+        tensorflow.keras model to a compact .npz file
+
+    quantize_dense_network()
+        Converts a DenseNetwork to a TFLite model with int8 kernels and
+        per-channel scales
+
+    compare_quantized_network()
+        Reports the output and reconstruction error differences and the
+        throughput of a quantized network against its float network
+
+CLASSES
+
+    DenseNetwork()
+        Numpy forward pass of a stack of Dense layers loaded from an
+        export_dense_npz() .npz file
+
+    QuantizedDenseNetwork()
+        Integer-GEMM forward pass of a stack of int8 quantized Dense layers,
+        run by the TFLite interpreter from a .tflite file written by its
+        save() method
+
+"""
+
+import time
+
+import numpy as np
+
+
+activation_functions = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1/(1 + np.exp(-x)),
+}
+
+
+def _dense_layers(model):
+    """Returns a flat list of the Dense layers in a (possibly nested) model
+    """
+    layers = []
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            layers += _dense_layers(layer)
+        elif layer.__class__.__name__=='Dense':
+            layers.append(layer)
+    return layers
+
+
+def export_dense_npz(model, path, compressed=True):
+    """Writes the Dense layer weights of a fitted keras model to a .npz file
+
+    Only Dense layers are exported, in order, with nested models (such as
+    the encoder and decoder inside a full autoencoder) flattened. Dropout
+    layers are omitted because they are inactive at inference time. This
+    function does not import tensorflow itself.
+
+    :param model: fitted tensorflow.keras model built from Dense layers, with
+                  any of the 'linear', 'relu', 'tanh', or 'sigmoid'
+                  activations
+    :param path: string, the file path of the resulting .npz file
+    :param compressed: boolean, whether the .npz file is zip compressed
+                       (default True)
+
+    :return: nothing is returned, the weights are written to path
+    """
+    arrays = {}
+    activations = []
+    for i, layer in enumerate(_dense_layers(model)):
+        activation = layer.get_config()['activation']
+        if activation not in activation_functions:
+            raise ValueError(
+                'Layer {} uses the unsupported activation {}'\
+                ''.format(layer.name, activation)
+            )
+        weights = layer.get_weights()
+        arrays['W_{}'.format(i)] = weights[0].astype(np.float32)
+        arrays['b_{}'.format(i)] = weights[1].astype(np.float32) \
+            if len(weights) > 1 else np.zeros(weights[0].shape[1], np.float32)
+        activations.append(activation)
+
+    savez = np.savez_compressed if compressed else np.savez
+    savez(path, activations=np.array(activations), **arrays)
+
+
+class DenseNetwork():
+    """Numpy forward pass of a stack of Dense layers
+
+    :param weights: list of 2D np.arrays, the kernel of each layer
+    :param biases: list of 1D np.arrays, the bias of each layer
+    :param activations: list of strings, the activation of each layer
+    """
+    def __init__(self, weights, biases, activations):
+        self.weights = [np.asarray(W, dtype=np.float32) for W in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = list(activations)
+        self.input_dim = self.weights[0].shape[0]
+        self.output_dim = self.weights[-1].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        """Loads a DenseNetwork from a file written by export_dense_npz()
+        """
+        with np.load(path) as npz:
+            activations = [str(a) for a in npz['activations']]
+            n_layers = len(activations)
+            weights = [npz['W_{}'.format(i)] for i in range(n_layers)]
+            biases = [npz['b_{}'.format(i)] for i in range(n_layers)]
+        return cls(weights, biases, activations)
+
+    def predict(self, X, batch_size=None):
+        """Generates network outputs for input data X
+
+        :param X: np.array or dataframe of shape (n, input_dim)
+        :param batch_size: integer or None, if set X is processed in batches
+                           of this many rows to bound memory use
+                           (default None processes X at once)
+
+        :return: np.array float32 of shape (n, output_dim)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if batch_size is None:
+            batch_size = max(len(X), 1)
+
+        output = np.empty((len(X), self.output_dim), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            out = X[start:start + batch_size]
+            for W, b, activation in zip(
+                self.weights, self.biases, self.activations
+            ):
+                out = activation_functions[activation](out @ W + b)
+            output[start:start + batch_size] = out
+
+        return output
+
+    def transform(self, X):
+        """Alias of predict(), matching the fitted UMAP mapper interface
+        """
+        return self.predict(X)
+
+
+def _tflite_interpreter(model_content, n_threads=None):
+    """Returns a TFLite interpreter for a flatbuffer, preferring the
+    standalone tflite_runtime package so that tensorflow is only imported
+    if it is not installed
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+
+    kwargs = {} if n_threads is None else {'num_threads': n_threads}
+    return Interpreter(model_content=model_content, **kwargs)
+
+
+def quantize_dense_network(network):
+    """Converts a DenseNetwork to a TFLite model with int8 kernels
+
+    The network is rebuilt as a tensorflow.keras model and converted with
+    TFLite dynamic range quantization, which stores each kernel as int8 with
+    one symmetric scale per output channel and keeps biases as float32. At
+    prediction time the TFLite runtime quantizes each layer input to int8
+    and computes the layer with an int8 x int8 -> int32 GEMM, so no
+    calibration data is needed. This function imports tensorflow.
+
+    :param network: DenseNetwork, for instance an encoder loaded from an
+                    export_dense_npz() or export_encoder() file
+
+    :return: QuantizedDenseNetwork object
+    """
+    import tensorflow as tf
+
+    layers = [tf.keras.Input(shape=(network.input_dim,))]
+    for W, activation in zip(network.weights, network.activations):
+        layers.append(tf.keras.layers.Dense(W.shape[1], activation=activation))
+    model = tf.keras.Sequential(layers)
+    for layer, W, b in zip(model.layers, network.weights, network.biases):
+        layer.set_weights([W, b])
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return QuantizedDenseNetwork(converter.convert())
+
+
+class QuantizedDenseNetwork():
+    """Integer-GEMM forward pass of a stack of int8 quantized Dense layers
+
+    Wraps a TFLite flatbuffer written by quantize_dense_network(), whose
+    fully connected layers multiply int8 inputs with int8 per-channel
+    quantized kernels accumulating in int32, and rescale the result to
+    float32 before adding the bias and applying the activation. The
+    interpreter comes from the tflite_runtime package if it is installed,
+    and from tensorflow otherwise.
+
+    :param model_content: bytes, the TFLite flatbuffer
+    :param n_threads: integer or None, the number of threads used by the
+                      interpreter (default None uses the TFLite default)
+    """
+    def __init__(self, model_content, n_threads=None):
+        self.model_content = bytes(model_content)
+        self.n_threads = n_threads
+        self._interpreter = None
+        self._batch_size = None
+
+        interpreter = self._get_interpreter(1)
+        self.input_dim = int(interpreter.get_input_details()[0]['shape'][1])
+        self.output_dim = int(
+            interpreter.get_output_details()[0]['shape'][1]
+        )
+
+    def __getstate__(self):
+        return {'model_content': self.model_content,
+                'n_threads': self.n_threads}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @classmethod
+    def load(cls, path, n_threads=None):
+        """Loads a QuantizedDenseNetwork from a .tflite file written by save()
+        """
+        with open(path, 'rb') as f:
+            return cls(f.read(), n_threads)
+
+    def save(self, path):
+        """Writes the TFLite flatbuffer to a .tflite file
+
+        :param path: string, the file path of the resulting .tflite file
+        """
+        with open(path, 'wb') as f:
+            f.write(self.model_content)
+
+    def _get_interpreter(self, batch_size):
+        """Returns the interpreter with tensors allocated for batch_size rows
+        """
+        if self._interpreter is None:
+            self._interpreter = _tflite_interpreter(
+                self.model_content, self.n_threads
+            )
+        if self._batch_size != batch_size:
+            input_details = self._interpreter.get_input_details()[0]
+            self._interpreter.resize_tensor_input(
+                input_details['index'],
+                [batch_size, input_details['shape'][1]]
+            )
+            self._interpreter.allocate_tensors()
+            self._batch_size = batch_size
+        return self._interpreter
+
+    def predict(self, X, batch_size=1024):
+        """Generates network outputs for input data X
+
+        :param X: np.array or dataframe of shape (n, input_dim)
+        :param batch_size: integer, the number of rows passed to the
+                           interpreter at once (default 1024)
+
+        :return: np.array float32 of shape (n, output_dim)
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        output = np.empty((len(X), self.output_dim), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            interpreter = self._get_interpreter(len(batch))
+            interpreter.set_tensor(
+                interpreter.get_input_details()[0]['index'], batch
+            )
+            interpreter.invoke()
+            output[start:start + batch_size] = interpreter.get_tensor(
+                interpreter.get_output_details()[0]['index']
+            )
+
+        return output
+
+    def transform(self, X):
+        """Alias of predict(), matching the fitted UMAP mapper interface
+        """
+        return self.predict(X)
+
+
+def _time_predict(network, X, n_repeats):
+    """Returns the best of n_repeats wall-clock times of network.predict(X)
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        network.predict(X)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_quantized_network(network, quantized, X, decoder=None,
+                              n_repeats=3):
+    """Reports the accuracy and speed of a quantized network against float
+
+    :param network: DenseNetwork, the float32 network, for instance an encoder
+    :param quantized: QuantizedDenseNetwork, the quantized network
+    :param X: np.array of shape (n, input_dim), the evaluation data
+    :param decoder: None or object with a predict() method, for instance a
+                    DenseNetwork or the keras decoder of the autoencoder, used
+                    to report the reconstruction error of X from the float
+                    and quantized encodings (default None)
+    :param n_repeats: integer, the number of timed predictions of each
+                      network, of which the fastest is reported (default 3)
+
+    :return: dict with keys 'max_abs_diff' and 'rmse_diff', the maximum and
+             root mean squared difference between the float and quantized
+             outputs, 'float_rows_per_sec' and 'quantized_rows_per_sec', the
+             throughput of each network on X, and, if a decoder is given,
+             'float_recon_mse', 'quantized_recon_mse', and 'recon_mse_diff',
+             the reconstruction MSE of X from each encoding and their
+             difference
+    """
+    X = np.asarray(X, dtype=np.float32)
+    float_out = network.predict(X)
+    quantized_out = quantized.predict(X)
+    diff = quantized_out - float_out
+
+    report = {
+        'max_abs_diff': float(np.abs(diff).max()),
+        'rmse_diff': float(np.sqrt(np.mean(diff**2))),
+        'float_rows_per_sec': len(X)/_time_predict(network, X, n_repeats),
+        'quantized_rows_per_sec':
+            len(X)/_time_predict(quantized, X, n_repeats),
+    }
+
+    if decoder is not None:
+        float_mse = float(np.mean((decoder.predict(float_out) - X)**2))
+        quantized_mse = float(
+            np.mean((decoder.predict(quantized_out) - X)**2)
+        )
+        report['float_recon_mse'] = float_mse
+        report['quantized_recon_mse'] = quantized_mse
+        report['recon_mse_diff'] = quantized_mse - float_mse
+
+    return report
@@ -0,0 +1,86 @@
+"""
+This module contains a helper for deferring imports of heavy dependencies
+(tensorflow, sklearn, scipy, matplotlib, hdbscan, umap, tqdm) until they are
+first used, so that importing any module in this package stays fast
+
+FUNCTIONS
+
+    lazy_import()
+        Returns a proxy for a module, or for an attribute of a module, that
+        performs the import the first time the proxy is used
+
+"""
+
+import importlib
+
+
+class _LazyImport():
+    """Proxy that imports a module (or a module attribute) on first use
+
+    Attribute access, calls, and isinstance() checks are all forwarded to
+    the imported object, so the proxy can be used in place of a module, a
+    class, or a function.
+    """
+    def __init__(self, module_name, attribute=None, on_import=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._on_import = on_import
+        self._object = None
+
+    def _load(self):
+        if self._object is None:
+            obj = importlib.import_module(self._module_name)
+            if self._on_import is not None:
+                self._on_import(obj)
+            if self._attribute is not None:
+                obj = getattr(obj, self._attribute)
+            self._object = obj
+        return self._object
+
+    def __getattr__(self, name):
+        # the proxy's own attributes are found without __getattr__, so only
+        # reaching here during unpickling/copying (before __init__) can ask
+        # for them; avoid recursing into _load() in that case
+        if name in ('_module_name', '_attribute', '_on_import', '_object'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._load())
+
+    def __repr__(self):
+        name = self._module_name if self._attribute is None \
+            else '{}.{}'.format(self._module_name, self._attribute)
+        if self._object is None:
+            return '<lazy import of {}>'.format(name)
+        return repr(self._object)
+
+
+def lazy_import(module_name, attribute=None, on_import=None):
+    """Returns a proxy that imports module_name the first time it is used
+
+    Typical usage at the top of a module replaces
+
+        import matplotlib.pyplot as plt
+        from sklearn.cluster import KMeans
+
+    with
+
+        plt = lazy_import('matplotlib.pyplot')
+        KMeans = lazy_import('sklearn.cluster', 'KMeans')
+
+    :param module_name: string, the full name of the module to import
+    :param attribute: None or string, if set the proxy stands in for this
+                      attribute of the module (for instance a class or
+                      function) rather than the module itself
+    :param on_import: None or function, called once with the imported module
+                      immediately after it is imported, for instance to set
+                      a random seed
+
+    :return: proxy object forwarding attribute access, calls, and isinstance
+             checks to the imported module or attribute
+    """
+    return _LazyImport(module_name, attribute, on_import)
@@ -17,13 +17,64 @@ FUNCTIONS
 
 import pandas as pd
 import numpy as np
-from sklearn.metrics import r2_score
+
+from .lazy import lazy_import
+
+r2_score = lazy_import('sklearn.metrics', 'r2_score')
+roc_auc_score = lazy_import('sklearn.metrics', 'roc_auc_score')
+is_classifier = lazy_import('sklearn.base', 'is_classifier')
+
+
+def _oob_output_predictions(fitted_model):
+    """Returns a list of the out-of-bag predictions of each output of a
+    fitted bagging-type sklearn model, the positive class probability for
+    classifiers, with NaN for observations that were never out-of-bag
+    """
+    if not is_classifier(fitted_model):
+        oob = np.asarray(fitted_model.oob_prediction_, dtype=float)
+        return list(oob.reshape(len(oob), -1).T)
+
+    decision = fitted_model.oob_decision_function_
+    classes = fitted_model.classes_
+    if isinstance(decision, list):
+        # multi-output classifiers of sklearn <1.0
+        outputs = decision
+    elif np.ndim(decision)==3:
+        outputs = [decision[:, :, i] for i in range(decision.shape[2])]
+    else:
+        outputs, classes = [decision], [classes]
+    return [
+        np.asarray(output, dtype=float)[:, np.argmax(output_classes)]
+        for output, output_classes in zip(outputs, classes)
+    ]
+
+
+def _oob_scores(FitModel, y_train):
+    """Returns the out-of-bag R^2 (regressors) or AUC (classifiers) of each
+    output of the fitted models, and the name of the metric
+    """
+    predictions = [
+        prediction for model in FitModel
+        for prediction in _oob_output_predictions(model)
+    ]
+    classifier = is_classifier(FitModel[0])
+    scores = []
+    for i, prediction in enumerate(predictions):
+        y = y_train.iloc[:, i].values
+        oob = np.isfinite(prediction)
+        if classifier and len(np.unique(y[oob])) < 2:
+            scores.append(np.nan)
+        elif classifier:
+            scores.append(roc_auc_score(y[oob], prediction[oob]))
+        else:
+            scores.append(r2_score(y[oob], prediction[oob]))
+    return np.array(scores), 'oob_auc' if classifier else 'oob_r2'
 
 
 def generate_model_dict(model, model_descr, X_train, X_test, y_train, y_test,
                         multioutput=True, verbose=False, predictions=True,
                         scores=True, model_api='sklearn', sm_formulas=None,
-                        y_stored=True, **kwargs):
+                        y_stored=True, oob_score=False, **kwargs):
     """Fits the specified model type and generates a dictionary of results
     
     This function works for fitting and generating predictions for 
@@ -49,7 +100,9 @@ def generate_model_dict(model, model_descr, X_train, X_test, y_train, y_test,
             }
             'score': {
                 'train': training r2_score array,
-                'test': test r2_score array
+                'test': test r2_score array,
+                'oob_r2' or 'oob_auc': out-of-bag score array
+                                      (only if oob_score=True)
             }
 
         }
@@ -77,6 +130,14 @@ def generate_model_dict(model, model_descr, X_train, X_test, y_train, y_test,
                      resulting dictionary. It is convenient to keep these stored
                      alongside the predictions for easier evaluation later (default
                      is y_stored=True)
+    :param oob_score: boolean, if True the sklearn model is fit with
+                      oob_score=True, which bagging-type estimators (such as
+                      RandomForest, ExtraTrees with bootstrap=True, and Bagging
+                      models) support, and the out-of-bag R-squared of each
+                      output (regressors) or AUC (classifiers) is stored in the
+                      score dict as 'oob_r2' or 'oob_auc', an estimate of
+                      generalization that needs no cross-validation refits
+                      (default is oob_score=False)
     :param **kwargs: are optional arguments that pass directly to the model object
                      at time of initialization, or in the case of the 'keras' model
                      api, they pass to the keras.mdoel.fit() method
@@ -99,6 +160,14 @@ def generate_model_dict(model, model_descr, X_train, X_test, y_train, y_test,
             "model_api only accepts 'sklearn', 'keras', or 'statsmodels', "\
             "but you have entered: {}".format(model_api)
         )
+    # check that out-of-bag scores are supported
+    if oob_score:
+        if model_api!='sklearn' or 'oob_score' not in model().get_params():
+            raise ValueError(
+                'oob_score=True requires a bagging-type sklearn model that '\
+                'accepts the oob_score parameter'
+            )
+        kwargs['oob_score'] = True
     
     # reset indices to prevent joining and index errors, particularly if using
     # scaled X dataframes
@@ -183,6 +252,9 @@ def generate_model_dict(model, model_descr, X_train, X_test, y_train, y_test,
             'train': r2_score(y_train, train_pred, multioutput='raw_values'),
             'test': r2_score(y_test, test_pred, multioutput='raw_values'),
         }
+        if oob_score:
+            oob_scores, oob_key = _oob_scores(FitModel, y_train)
+            model_dict['score'][oob_key] = oob_scores
     
     if verbose:
         print("\t{}".format(FitModel))
@@ -227,5 +299,10 @@ def print_model_results(model_dict, score='both'):
                 print('\t\tTraining\t{:.4f}'.format(model_dict['score']['train'][i]))
             if score in test_opt:
                 print('\t\tTest\t\t{:.4f}'.format(model_dict['score']['test'][i]))
+            for oob_key, oob_name in [('oob_r2', 'OOB R2'), ('oob_auc', 'OOB AUC')]:
+                if score=='both' and oob_key in model_dict['score']:
+                    print('\t\t{}\t\t{:.4f}'.format(
+                        oob_name, model_dict['score'][oob_key][i]
+                    ))
             print()
         print('\n')
@@ -16,6 +16,10 @@ FUNCTIONS
         sklearn scalers and allows you to specify features you do not want
         affected by scaling by using the exclude_scale_cols parameter.
 
+    encode_categories_sparse()
+        One-hot-encodes one or more categorical columns directly into a
+        scipy sparse csr matrix, without creating dense dummy columns
+
     sigmoid()
         Efficient numpy-based sigmoid transformation of a dataframe, array,
         or matrix
@@ -28,7 +32,11 @@ FUNCTIONS
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import RobustScaler
+
+from .lazy import lazy_import
+
+sparse = lazy_import('scipy.sparse')
+RobustScaler = lazy_import('sklearn.preprocessing', 'RobustScaler')
 
 
 def scale_features(train_df, val_df, exclude_scale_cols=[],
@@ -244,3 +252,65 @@ def encode_categories(data, colname, one_hot=True, drop_cat=None,
     data_copy.columns = [col.replace(' ', '_') for col in data_copy.columns]
 
     return data_copy
+
+
+def encode_categories_sparse(data, colnames, cat_lists=None,
+                             numeric_cols=None, append_colname=True):
+    """One-hot-encodes categorical columns directly into a sparse csr matrix
+
+    Unlike encode_categories(), which appends dense dummy columns to the
+    dataframe, this never creates a dense one-hot array, so it scales to
+    datasets with many rows and many category values. Category values not
+    found in a provided cat_list are encoded as all zeros.
+
+    :param data: The pd.dataframe object containing the columns you wish to
+                 encode
+    :param colnames: list of strings, the names of the columns to encode
+    :param cat_lists: None or dict mapping column names to the full list of
+                      category values for that column, which fixes the
+                      column ordering so that separately encoded chunks of
+                      data line up. Columns not in the dict default to
+                      alphabetical order of their values (default None)
+    :param numeric_cols: None or list of numeric column names appended as
+                         additional columns after the encoded categories
+                         (default None)
+    :param append_colname: Boolean, whether resulting column names are
+                           prefixed with the original column name, such as
+                           'Borough_Queens' (default True)
+
+    :return: tuple, [0] scipy.sparse.csr_matrix of the encoded data, [1] list
+             of resulting column names with spaces replaced by underscores
+    """
+    cat_lists = cat_lists or {}
+    n_rows = len(data)
+    rows = np.arange(n_rows)
+
+    blocks = []
+    column_names = []
+    for colname in colnames:
+        values = data[colname].astype(str)
+        cat_list = cat_lists.get(colname, sorted(set(values)))
+        codes = pd.Categorical(values, categories=cat_list).codes
+
+        known = codes != -1
+        blocks.append(
+            sparse.csr_matrix(
+                (np.ones(known.sum(), dtype=np.float32),
+                 (rows[known], codes[known])),
+                shape=(n_rows, len(cat_list))
+            )
+        )
+        column_names += [
+            '{}_{}'.format(colname, cat) if append_colname else str(cat)
+            for cat in cat_list
+        ]
+
+    if numeric_cols:
+        blocks.append(
+            sparse.csr_matrix(data[numeric_cols].values.astype(np.float32))
+        )
+        column_names += list(numeric_cols)
+
+    column_names = [col.replace(' ', '_') for col in column_names]
+
+    return sparse.hstack(blocks, format='csr'), column_names
@@ -0,0 +1,257 @@
+"""
+This module contains a dataset handle that places the numeric train and test
+design matrices and responses in shared memory (or memory-mapped files) once,
+so that parallel worker processes can read any attribute subset without the
+DataFrames being pickled into each worker
+
+PARAMETERS
+
+    response_columns = ['Budget_Change_Ratio', 'Schedule_Change_Ratio']
+        The default response columns stored by SharedDataset.create(), the
+        same responses modeled by trees.calculate()
+
+CLASSES
+
+    SharedDataset()
+        Handle to train and test design matrices and responses held in
+        multiprocessing.shared_memory (Python 3.8+) or in memory-mapped .npy
+        files, which pickles as a few bytes of metadata and re-attaches to
+        the same memory when unpickled in a worker
+
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python <3.8, use memory-mapped files instead
+    shared_memory = None
+
+
+response_columns = ['Budget_Change_Ratio', 'Schedule_Change_Ratio']
+
+
+class SharedDataset():
+    """Handle to train and test data held in shared memory or memmapped files
+
+    Build one with SharedDataset.create() in the parent process and pass it
+    to workers, for instance as an argument of ProcessPoolExecutor.submit().
+    Only the metadata (column names, shapes, and the shared memory names or
+    file paths) is pickled, and each worker re-attaches read-only NumPy
+    arrays to the same memory.
+
+    The design matrices are stored column-major, so every column, and every
+    run of adjacent columns (such as the dummy or embedding columns of one
+    attribute expanded by trees.expand_attributes()), is a zero-copy view.
+    Other attribute subsets are gathered column by column straight from the
+    shared memory, which copies only the selected columns.
+
+    The process that called create() owns the memory and should call close()
+    (or use the handle as a context manager) once the workers are done, which
+    frees the shared memory or deletes the temporary files.
+
+    :param metadata: dict, the metadata written by create()
+    :param owner: boolean, whether close() frees the underlying memory
+                  (default False)
+    """
+    def __init__(self, metadata, owner=False):
+        self.metadata = metadata
+        self.columns = list(metadata['columns'])
+        self.responses = list(metadata['responses'])
+        self._positions = {c: i for i, c in enumerate(self.columns)}
+        self._owner = owner
+        self._shared_memory = []
+
+        self.arrays = {}
+        for key, spec in metadata['arrays'].items():
+            self.arrays[key] = self._attach(spec)
+
+    def _attach(self, spec):
+        """Returns a read-only array over shared memory or a memmapped file
+        """
+        if self.metadata['backend']=='shared_memory':
+            shm = shared_memory.SharedMemory(name=spec['name'])
+            self._shared_memory.append(shm)
+            array = np.ndarray(
+                tuple(spec['shape']), dtype=np.dtype(spec['dtype']),
+                buffer=shm.buf, order='F'
+            )
+            array.flags.writeable = False
+            return array
+        return np.load(spec['path'], mmap_mode='r')
+
+    @classmethod
+    def create(cls, data_train, data_test, columns=None,
+               responses=response_columns, path=None, dtype=np.float64):
+        """Copies train and test data into shared memory or memmapped files
+
+        :param data_train: dataframe, the training data
+        :param data_test: dataframe, the test data, with the same columns
+        :param columns: None or list of strings, the design matrix columns
+                        (default None uses every numeric or boolean column
+                        that is not a response)
+        :param responses: list of strings, the response columns
+                          (default response_columns)
+        :param path: None or string, if set the arrays are written as .npy
+                     files to this directory and memory-mapped, otherwise
+                     multiprocessing.shared_memory is used where available
+                     and temporary memory-mapped files where it is not
+                     (default None)
+        :param dtype: numpy dtype of the stored arrays (default np.float64)
+
+        :return: SharedDataset object that owns the memory
+        """
+        if columns is None:
+            columns = [
+                c for c in data_train.select_dtypes(
+                    include=[np.number, 'bool']
+                ).columns if c not in responses
+            ]
+
+        if path is None and shared_memory is not None:
+            backend = 'shared_memory'
+        else:
+            backend = 'memmap'
+
+        metadata = {
+            'backend': backend,
+            'columns': list(columns),
+            'responses': list(responses),
+            'arrays': {},
+            'temporary_dir': None,
+        }
+        if backend=='memmap':
+            if path is None:
+                path = tempfile.mkdtemp(prefix='shared_dataset_')
+                metadata['temporary_dir'] = path
+            os.makedirs(path, exist_ok=True)
+
+        frames = {
+            'X_train': data_train[columns],
+            'X_test': data_test[columns],
+            'y_train': data_train[responses],
+            'y_test': data_test[responses],
+        }
+        for key, frame in frames.items():
+            values = np.asfortranarray(frame.values, dtype=dtype)
+            spec = {'shape': list(values.shape), 'dtype': values.dtype.str}
+            if backend=='shared_memory':
+                shm = shared_memory.SharedMemory(
+                    create=True, size=max(values.nbytes, 1)
+                )
+                np.ndarray(
+                    values.shape, dtype=values.dtype, buffer=shm.buf,
+                    order='F'
+                )[:] = values
+                spec['name'] = shm.name
+                shm.close()
+            else:
+                spec['path'] = os.path.join(path, '{}.npy'.format(key))
+                np.save(spec['path'], values)
+            metadata['arrays'][key] = spec
+
+        return cls(metadata, owner=True)
+
+    def __getstate__(self):
+        return self.metadata
+
+    def __setstate__(self, metadata):
+        self.__init__(metadata)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def positions(self, attributes):
+        """Returns the design matrix column positions of a list of columns
+        """
+        missing = [a for a in attributes if a not in self._positions]
+        if missing:
+            raise KeyError(
+                'The columns {} are not in the shared dataset'.format(missing)
+            )
+        return [self._positions[a] for a in attributes]
+
+    def _select(self, key, positions):
+        """Returns the columns at positions of an array, as a view if the
+        positions are evenly spaced and increasing
+        """
+        array = self.arrays[key]
+        if len(positions)==1:
+            return array[:, positions[0]:positions[0] + 1]
+        steps = np.diff(positions)
+        if len(positions) > 1 and steps[0] > 0 and (steps==steps[0]).all():
+            return array[:, positions[0]:positions[-1] + 1:steps[0]]
+        return array[:, positions]
+
+    def get(self, attributes):
+        """Returns the train and test design matrices of a list of columns
+
+        :param attributes: list of strings, column names, for instance as
+                           returned by trees.expand_attributes()
+
+        :return: tuple of 2D np.arrays, [0] train, [1] test design matrix
+        """
+        positions = self.positions(attributes)
+        return (
+            self._select('X_train', positions),
+            self._select('X_test', positions),
+        )
+
+    def train_and_test(self, attributes, logistic=False):
+        """Returns train and test dataframes of a list of columns
+
+        The same outputs as trees.define_train_and_test() with the stored
+        responses. The X dataframes wrap the arrays of get() without a
+        further copy and have a default RangeIndex.
+
+        :param attributes: list of strings, column names, for instance as
+                           returned by trees.expand_attributes()
+        :param logistic: boolean, whether the responses are converted to 1
+                         if >0 and 0 otherwise (default False)
+
+        :return: tuple of 4 dataframes, X_tr, X_te, y_tr, y_te
+        """
+        X_tr, X_te = self.get(attributes)
+        X_tr = pd.DataFrame(X_tr, columns=attributes, copy=False)
+        X_te = pd.DataFrame(X_te, columns=attributes, copy=False)
+
+        y_tr = pd.DataFrame(
+            self.arrays['y_train'], columns=self.responses, copy=False
+        )
+        y_te = pd.DataFrame(
+            self.arrays['y_test'], columns=self.responses, copy=False
+        )
+        if logistic:
+            y_tr = (y_tr>0)*1
+            y_te = (y_te>0)*1
+
+        return X_tr, X_te, y_tr, y_te
+
+    def close(self):
+        """Detaches from the memory, and frees it if this handle owns it
+        """
+        self.arrays = {}
+        for shm in self._shared_memory:
+            try:
+                shm.close()
+            except BufferError:
+                # views handed out by get() are still alive, the memory is
+                # released once they are garbage collected
+                pass
+            if self._owner:
+                shm.unlink()
+        self._shared_memory = []
+
+        temporary_dir = self.metadata.get('temporary_dir')
+        if self._owner and temporary_dir is not None:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+        self._owner = False
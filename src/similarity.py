@@ -0,0 +1,183 @@
+"""
+This module contains an index for finding the projects with the most similar
+descriptions, based on the cosine similarity of description embeddings
+
+FUNCTIONS
+
+    top_k_similar()
+        Finds the k highest cosine similarity rows of a normalized embedding
+        matrix for each query vector, computed in blocks of rows
+
+CLASSES
+
+    SimilarityIndex()
+        Nearest-similar-project search index over description embeddings,
+        queried by PID or by raw description text
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .lazy import lazy_import
+from .embeddings import output_layer_num, embed_text
+
+KMeans = lazy_import('sklearn.cluster', 'KMeans')
+
+
+def _normalize(vectors):
+    """Returns float32 copies of vectors scaled to unit length
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k_similar(queries, matrix, k=20, block_size=65536):
+    """Finds the k most similar rows of matrix for each query vector
+
+    Similarities are computed as a matrix multiply against blocks of rows,
+    so memory use is bounded by block_size rather than the number of rows,
+    and only the running top k of each query is kept between blocks.
+
+    :param queries: 2D np.array of unit length float32 query vectors
+    :param matrix: 2D np.array of unit length float32 vectors to search
+    :param k: integer, the number of most similar rows returned per query
+    :param block_size: integer, the number of matrix rows per block
+
+    :return: tuple, [0] int np.array of row positions with shape (m, k),
+             [1] float32 np.array of cosine similarities with shape (m, k),
+             each sorted by decreasing similarity
+    """
+    n_rows = len(matrix)
+    k = min(k, n_rows)
+    best_positions = np.empty((len(queries), 0), dtype=np.intp)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+    for start in range(0, n_rows, block_size):
+        scores = queries @ matrix[start:start + block_size].T
+        n_keep = min(k, scores.shape[1])
+        top = np.argpartition(-scores, n_keep - 1, axis=1)[:, :n_keep]
+
+        best_positions = np.hstack([best_positions, top + start])
+        best_scores = np.hstack(
+            [best_scores, np.take_along_axis(scores, top, axis=1)]
+        )
+        if best_positions.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_positions = np.take_along_axis(best_positions, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return (
+        np.take_along_axis(best_positions, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1),
+    )
+
+
+class SimilarityIndex():
+    """Nearest-similar-project search index over description embeddings
+
+    Embeddings are stored as a unit length float32 matrix so that cosine
+    similarity is a single matrix multiply. By default every query is
+    scored exactly against all projects with top_k_similar(). For very
+    large catalogs, setting n_lists builds an inverted file (IVF) index,
+    which partitions the projects with kmeans and only scores the projects
+    in the n_probe partitions closest to each query.
+
+    :param embeddings: 2D array-like of embeddings, one row per PID
+    :param pids: array-like of PIDs in the same order as embeddings
+    :param n_lists: integer or None, the number of IVF partitions, None
+                    uses exact search (default None)
+    :param random_state: integer, seed used to fit the IVF partitions
+    """
+    def __init__(self, embeddings, pids, n_lists=None, random_state=109):
+        self.matrix = _normalize(embeddings)
+        self.pids = np.asarray(pids)
+        self.index = pd.Index(self.pids)
+        self.n_lists = n_lists
+
+        if n_lists is not None:
+            quantizer = KMeans(
+                n_clusters=n_lists, n_init=1, random_state=random_state
+            ).fit(self.matrix)
+            self.centroids = _normalize(quantizer.cluster_centers_)
+            # store rows grouped by partition with offsets into that order
+            self.list_order = np.argsort(quantizer.labels_, kind='stable')
+            list_sizes = np.bincount(quantizer.labels_, minlength=n_lists)
+            self.list_offsets = np.concatenate([[0], np.cumsum(list_sizes)])
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Builds a SimilarityIndex from an embeddings.EmbeddingStore
+        """
+        return cls(store.embeddings, store.pids, **kwargs)
+
+    def _search(self, query, k, n_probe):
+        """Returns the row positions and scores of the top k rows for a query
+        """
+        if self.n_lists is None:
+            positions, scores = top_k_similar(query, self.matrix, k)
+            return positions[0], scores[0]
+
+        probe = np.argsort(-(self.centroids @ query[0]))[:n_probe]
+        candidates = np.concatenate([
+            self.list_order[self.list_offsets[i]:self.list_offsets[i + 1]]
+            for i in probe
+        ])
+        positions, scores = top_k_similar(query, self.matrix[candidates], k)
+        return candidates[positions[0]], scores[0]
+
+    def query_vector(self, vector, k=20, n_probe=8, exclude_pids=None):
+        """Finds the k projects most similar to an embedding vector
+
+        :param vector: 1D array-like embedding
+        :param k: integer, the number of similar projects returned
+        :param n_probe: integer, the number of IVF partitions searched,
+                        ignored by exact search (default 8)
+        :param exclude_pids: None or list of PIDs to leave out of the
+                             results, such as the queried project itself
+
+        :return: pd.DataFrame with 'PID' and 'score' (cosine similarity)
+                 columns, sorted by decreasing similarity
+        """
+        n_exclude = 0 if exclude_pids is None else len(exclude_pids)
+        positions, scores = self._search(
+            _normalize(vector), k + n_exclude, n_probe
+        )
+
+        results = pd.DataFrame({'PID': self.pids[positions], 'score': scores})
+        if n_exclude:
+            results = results[~results['PID'].isin(exclude_pids)]
+        return results.head(k).reset_index(drop=True)
+
+    def query_pid(self, pid, k=20, n_probe=8):
+        """Finds the k projects most similar to an indexed project
+
+        :param pid: the PID of a project in the index, which is excluded
+                    from its own results
+
+        :return: pd.DataFrame with 'PID' and 'score' columns
+        """
+        position = self.index.get_loc(pid)
+        return self.query_vector(
+            self.matrix[position], k, n_probe, exclude_pids=[pid]
+        )
+
+    def query_text(self, text, model_path, k=20, n_probe=8,
+                   layer_num=output_layer_num):
+        """Finds the k projects most similar to a raw description text
+
+        The text is embedded with embeddings.embed_text(), using the same
+        cleaning and BERT model as embeddings.embed_descriptions(), and the
+        model is loaded only once per process across repeated queries.
+
+        :param text: string, the description to search with
+        :param model_path: string, path to the pretrained BERT directory
+                           used to generate the indexed embeddings
+
+        :return: pd.DataFrame with 'PID' and 'score' columns
+        """
+        vector = embed_text(text, model_path, layer_num)
+        return self.query_vector(vector, k, n_probe)
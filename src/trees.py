@@ -10,6 +10,13 @@ PARAMETERS
     cv = 5
         sets cross-validation kfold parameter
 
+    hgb_depths = [1, 2, 3, 4, 6, 8, 10]
+        sets default max depths compared for histogram gradient boosting
+
+    hgb_params
+        sets default histogram gradient boosting settings, including up to
+        500 iterations with early stopping on a 10% validation fraction
+
 FUNCTIONS
 
     generate_adaboost_staged_scores()
@@ -20,9 +27,21 @@ FUNCTIONS
         Plots the adaboost staged scores for each y variable's predictions
         and iteration
 
+    generate_warm_start_scores()
+        Grows an ensemble incrementally with warm_start to record train and
+        test scores over a sweep of n_estimators at the cost of one fit
+
     calc_meanstd_logistic()
+        Fits and scores classification trees of each depth, optionally
+        histogram trees on pre-binned uint8 attributes (see histtree.py)
 
     calc_meanstd_regression()
+        Fits and scores regression trees of each depth, optionally
+        histogram trees on pre-binned uint8 attributes (see histtree.py)
+
+    calc_hist_gradient_boosting()
+        Fits and scores histogram gradient boosting models of each max
+        depth, with early stopping and native categorical features
 
     define_train_and_test()
         Return x and y data for train and test sets
@@ -48,15 +67,42 @@ import itertools
 
 import numpy as np
 import pandas as pd
-from tqdm.notebook import tqdm
-import matplotlib.pyplot as plt
 
-from sklearn.metrics import accuracy_score, roc_auc_score
-from sklearn.model_selection import cross_val_score
+from .lazy import lazy_import
+from .model import generate_model_dict
+from .shared_data import SharedDataset
+from .histtree import FeatureBins, HistTree
 
-from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+tqdm = lazy_import('tqdm.notebook', 'tqdm')
+plt = lazy_import('matplotlib.pyplot')
+
+accuracy_score = lazy_import('sklearn.metrics', 'accuracy_score')
+r2_score = lazy_import('sklearn.metrics', 'r2_score')
+roc_auc_score = lazy_import('sklearn.metrics', 'roc_auc_score')
+cross_val_score = lazy_import('sklearn.model_selection', 'cross_val_score')
+check_cv = lazy_import('sklearn.model_selection', 'check_cv')
+is_classifier = lazy_import('sklearn.base', 'is_classifier')
+
+DecisionTreeClassifier = lazy_import('sklearn.tree', 'DecisionTreeClassifier')
+DecisionTreeRegressor = lazy_import('sklearn.tree', 'DecisionTreeRegressor')
+
+
+def _enable_hist_gradient_boosting(module):
+    """Enables the experimental histogram gradient boosting models of
+    sklearn <1.0, which are importable by default in later versions
+    """
+    if not hasattr(module, 'HistGradientBoostingRegressor'):
+        import sklearn.experimental.enable_hist_gradient_boosting
 
-from .model import generate_model_dict
+
+HistGradientBoostingClassifier = lazy_import(
+    'sklearn.ensemble', 'HistGradientBoostingClassifier',
+    _enable_hist_gradient_boosting
+)
+HistGradientBoostingRegressor = lazy_import(
+    'sklearn.ensemble', 'HistGradientBoostingRegressor',
+    _enable_hist_gradient_boosting
+)
 
 
 # Calculate train and test scores for model inputs and outputs
@@ -64,6 +110,17 @@ from .model import generate_model_dict
 depths = list(range(1, 21))
 cv = 5
 
+hgb_depths = [1, 2, 3, 4, 6, 8, 10]
+hgb_params = {
+    'max_iter': 500,
+    'learning_rate': 0.1,
+    'max_leaf_nodes': None,
+    'early_stopping': True,
+    'validation_fraction': 0.1,
+    'n_iter_no_change': 10,
+    'random_state': 109,
+}
+
 
 def generate_adaboost_staged_scores(model_dict, X_train, X_test, y_train, y_test):
     """Generates adaboost staged scores in order to find ideal number of iterations
@@ -159,7 +216,206 @@ def plot_adaboost_staged_scores(model_dict, X_train, X_test, y_train, y_test, he
     plt.show()
 
 
-def calc_meanstd_logistic(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=cv):
+def _bagging_oob_score(fitted, X, y, oob_state):
+    """Returns the out-of-bag R^2 or accuracy of a warm-started sklearn
+    Bagging model, which cannot compute oob_score_ itself with warm_start
+
+    Must be called after every fit. The out-of-bag predictions (class
+    probabilities for classifiers) of the estimators added by the latest
+    fit are accumulated in oob_state, so growing the ensemble only predicts
+    with the new estimators. Observations that were never out-of-bag are left out of the score.
+    """
+    classifier = is_classifier(fitted)
+    if not oob_state:
+        n_outputs = len(fitted.classes_) if classifier else 1
+        oob_state['sums'] = np.zeros((len(X), n_outputs))
+        oob_state['counts'] = np.zeros(len(X))
+        oob_state['n_estimators'] = 0
+
+    # after a warm-started fit, estimators_samples_ only covers the
+    # estimators added by that fit
+    new = slice(oob_state['n_estimators'], len(fitted.estimators_))
+    for estimator, samples, features in zip(
+        fitted.estimators_[new], fitted.estimators_samples_,
+        fitted.estimators_features_[new]
+    ):
+        oob = np.ones(len(X), dtype=bool)
+        oob[samples] = False
+        X_oob = X[oob][:, features]
+        if classifier:
+            # estimators are fit on class indices, possibly missing some
+            oob_state['sums'][np.ix_(oob, estimator.classes_.astype(int))] \
+                += estimator.predict_proba(X_oob)
+        else:
+            oob_state['sums'][oob, 0] += estimator.predict(X_oob)
+        oob_state['counts'] += oob
+    oob_state['n_estimators'] = len(fitted.estimators_)
+
+    seen = oob_state['counts'] > 0
+    if classifier:
+        prediction = fitted.classes_[oob_state['sums'][seen].argmax(axis=1)]
+        return accuracy_score(y[seen], prediction)
+    prediction = oob_state['sums'][seen, 0] / oob_state['counts'][seen]
+    return r2_score(y[seen], prediction)
+
+
+def generate_warm_start_scores(model, X_train, X_test, y_train, y_test,
+                               n_estimators_list, oob_score=False, **kwargs):
+    """Grows one ensemble per response with warm_start and scores each size
+
+    Rather than refitting an ensemble from scratch for every value in
+    n_estimators_list, a single model per response is fit with
+    warm_start=True and grown to each number of estimators in increasing
+    order, so the whole sweep costs about as much as fitting the largest
+    ensemble once. With a fixed random_state, a random forest grown this way
+    is identical to one fit directly with the same number of trees.
+
+    :param model: the uninitialized sklearn ensemble model class supporting
+                  warm_start, such as RandomForestRegressor,
+                  ExtraTreesRegressor, GradientBoostingRegressor, or
+                  BaggingRegressor (or their classifiers), or a
+                  HistGradientBoosting model, which is grown by max_iter
+    :param X_train, X_test, y_train, y_test: the datasets on which to fit and
+                                             evaluate the models, with one
+                                             y column per response
+    :param n_estimators_list: list of integers, the ensemble sizes at which
+                              scores are recorded, for instance
+                              list(range(50, 1001, 50))
+    :param oob_score: boolean, if True the out-of-bag score of each size is
+                      also recorded (default False). Only models with a
+                      bootstrap parameter are supported: random forests and
+                      extra trees are fit with oob_score=True and
+                      bootstrap=True (the extra trees default is False), and
+                      the warm-started Bagging models, for which sklearn
+                      cannot compute oob_score_, are scored from their
+                      estimators_samples_
+    :param kwargs: additional arguments passed to the model at
+                   initialization, such as max_depth or random_state
+
+    :return: dict with keys 'n_estimators' (1D np.array of the sorted sizes),
+             'train' and 'test' (2D np.arrays of model.score() values, the
+             R^2 or accuracy, with one row per size and one column per
+             response), 'oob' (the same for out-of-bag R^2 or accuracy
+             scores, only if oob_score=True), and 'models' (list of the fitted models at the
+             largest size, one per response)
+    """
+    X_train = X_train.reset_index(drop=True)
+    X_test = X_test.reset_index(drop=True)
+    y_train = pd.DataFrame(y_train).reset_index(drop=True)
+    y_test = pd.DataFrame(y_test).reset_index(drop=True)
+    n_estimators_list = np.sort(np.unique(n_estimators_list))
+
+    params = model().get_params()
+    size_param = 'n_estimators' if 'n_estimators' in params else 'max_iter'
+    bagging = 'estimator' in params or 'base_estimator' in params
+    if oob_score:
+        if 'bootstrap' not in params:
+            raise ValueError(
+                'oob_score=True requires a model with a bootstrap parameter, '\
+                'such as a random forest, extra trees, or bagging model, '\
+                'but {} has none'.format(model.__name__)
+            )
+        if not kwargs.get('bootstrap', True):
+            raise ValueError('oob_score=True requires bootstrap=True')
+        kwargs['bootstrap'] = True
+        if not bagging:
+            kwargs['oob_score'] = True
+
+    models = [
+        model(warm_start=True, **kwargs) for _ in range(y_train.shape[1])
+    ]
+    train_scores = np.zeros((len(n_estimators_list), len(models)))
+    test_scores = np.zeros((len(n_estimators_list), len(models)))
+    oob_scores = np.zeros((len(n_estimators_list), len(models)))
+    oob_states = [{} for _ in models]
+
+    for i, n_estimators in enumerate(n_estimators_list):
+        for j, fitted in enumerate(models):
+            fitted.set_params(**{size_param: int(n_estimators)})
+            fitted.fit(X_train, y_train.iloc[:, j])
+            train_scores[i, j] = fitted.score(X_train, y_train.iloc[:, j])
+            test_scores[i, j] = fitted.score(X_test, y_test.iloc[:, j])
+            if oob_score and bagging:
+                oob_scores[i, j] = _bagging_oob_score(
+                    fitted, X_train.values, y_train.iloc[:, j].values,
+                    oob_states[j]
+                )
+            elif oob_score:
+                oob_scores[i, j] = fitted.oob_score_
+
+    scores = {
+        'n_estimators': n_estimators_list,
+        'train': train_scores,
+        'test': test_scores,
+        'models': models,
+    }
+    if oob_score:
+        scores['oob'] = oob_scores
+
+    return scores
+
+
+def _calc_meanstd_histogram(X_tr, y_tr, X_te, y_te, depths, cv, logistic):
+    """Depth sweep of calc_meanstd_logistic() and calc_meanstd_regression()
+    on uint8 binned features with histtree.HistTree
+
+    One tree per data split is grown to max(depths) and then evaluated at
+    each depth, rather than refitting a tree for every depth.
+    """
+    X_tr, X_te = np.asarray(X_tr), np.asarray(X_te)
+    y_tr, y_te = np.asarray(y_tr), np.asarray(y_te)
+    max_depth = max(depths)
+
+    def cv_scores(X, y):
+        folds = check_cv(cv, y, classifier=logistic).split(X, y)
+        scores = []
+        for fold_train, fold_test in folds:
+            tree = HistTree(max_depth, classification=logistic).fit(
+                X[fold_train], y[fold_train]
+            )
+            scores.append(
+                [tree.score(X[fold_test], y[fold_test], d) for d in depths]
+            )
+        return np.array(scores)
+
+    cvmeans = cv_scores(X_tr, y_tr).mean(axis=0)
+    cvstds = cv_scores(X_te, y_te).std(axis=0)
+
+    model = HistTree(max_depth, classification=logistic).fit(X_tr, y_tr)
+    models = [model.truncate(d) for d in depths]
+
+    if logistic:
+        # use AUC scoring
+        train_scores = np.array(
+            [roc_auc_score(y_tr, m.predict(X_tr)) for m in models]
+        )
+        test_scores = np.array(
+            [roc_auc_score(y_te, m.predict(X_te)) for m in models]
+        )
+    else:
+        # use R2 scoring
+        train_scores = np.array([m.score(X_tr, y_tr) for m in models])
+        test_scores = np.array([m.score(X_te, y_te) for m in models])
+
+    return cvmeans, cvstds, train_scores, test_scores, models
+
+
+def calc_meanstd_logistic(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=cv,
+                          histogram=False):
+    """Fits and scores classification trees of each depth
+
+    With histogram=True, X_tr and X_te must be uint8 binned matrices (see
+    histtree.FeatureBins) and histtree.HistTree models are fit instead of
+    DecisionTreeClassifier, one per data split for all depths. Their scores
+    approximate those of DecisionTreeClassifier, which can break ties between
+    splits differently and is not limited to the bin edges of attributes
+    with more than 256 distinct values
+    """
+    if histogram:
+        return _calc_meanstd_histogram(
+            X_tr, y_tr, X_te, y_te, depths, cv, logistic=True
+        )
+
     cvmeans = []
     cvstds = []
     train_scores = []
@@ -189,7 +445,22 @@ def calc_meanstd_logistic(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=cv)
     return cvmeans, cvstds, train_scores, test_scores, models
 
 
-def calc_meanstd_regression(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=cv):
+def calc_meanstd_regression(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=cv,
+                            histogram=False):
+    """Fits and scores regression trees of each depth
+
+    With histogram=True, X_tr and X_te must be uint8 binned matrices (see
+    histtree.FeatureBins) and histtree.HistTree models are fit instead of
+    DecisionTreeRegressor, one per data split for all depths. Their scores
+    approximate those of DecisionTreeRegressor, which can break ties between
+    splits differently and is not limited to the bin edges of attributes
+    with more than 256 distinct values
+    """
+    if histogram:
+        return _calc_meanstd_histogram(
+            X_tr, y_tr, X_te, y_te, depths, cv, logistic=False
+        )
+
     cvmeans = []
     cvstds = []
     train_scores = []
@@ -219,10 +490,125 @@ def calc_meanstd_regression(X_tr, y_tr, X_te, y_te, depths:list=depths, cv:int=c
     return cvmeans, cvstds, train_scores, test_scores, models
 
 
+def _collapse_categories(X_tr, X_te, categories):
+    """Replaces the category dummy columns with one integer coded column
+
+    The 'Category' column codes each observation by the position of its
+    dummy in categories plus 1, or 0 if none of the dummies are set (the
+    dropped category). If the installed sklearn supports native categorical
+    features, the dummies are collapsed and the mask of categorical columns
+    is returned, otherwise the data is returned unchanged with None.
+
+    :return: tuple, X_tr, X_te, and the boolean categorical_features mask
+    """
+    dummies = [c for c in categories if c in X_tr.columns]
+    supported = 'categorical_features' in \
+        HistGradientBoostingRegressor().get_params()
+    if not dummies or not supported:
+        return X_tr, X_te, None
+
+    def collapse(X):
+        codes = X[dummies].values
+        X = X.drop(columns=dummies)
+        X['Category'] = np.where(
+            codes.any(axis=1), codes.argmax(axis=1) + 1, 0
+        )
+        return X
+
+    X_tr, X_te = collapse(X_tr), collapse(X_te)
+    return X_tr, X_te, np.array([c=='Category' for c in X_tr.columns])
+
+
+def calc_hist_gradient_boosting(X_tr, y_tr, X_te, y_te,
+                                depths:list=hgb_depths, logistic=True,
+                                categorical_features=None, **kwargs):
+    """Fits and scores histogram gradient boosting models of each max depth
+
+    Each model is a sklearn HistGradientBoostingClassifier (logistic=True)
+    or HistGradientBoostingRegressor with the hgb_params settings, which
+    bins the features, trains on all cores with OpenMP, and stops adding
+    trees once the loss on a held out validation_fraction of the training
+    data stops improving. Multi-output responses are fit with one model per
+    response. No cross validation is run, so the returned cvmeans and cvstds
+    are NaN, but the outputs otherwise match calc_meanstd_logistic() and
+    calc_meanstd_regression().
+
+    :param X_tr, y_tr, X_te, y_te: the train and test data
+    :param depths: list of integers, the max_depth of each model
+                   (default hgb_depths)
+    :param logistic: boolean, whether classifiers scored with AUC or
+                     regressors scored with R^2 are fit (default True)
+    :param categorical_features: None or boolean mask of the columns of X
+                                 treated as native categorical features
+                                 (default None)
+    :param kwargs: additional arguments passed to the sklearn model,
+                   overriding hgb_params
+
+    :return: tuple, cvmeans, cvstds, train_scores, test_scores, and the list
+             of fitted models (lists of one model per response for
+             multi-output responses)
+    """
+    Model = HistGradientBoostingClassifier if logistic \
+        else HistGradientBoostingRegressor
+    params = dict(hgb_params, **kwargs)
+    if categorical_features is not None:
+        params['categorical_features'] = categorical_features
+
+    y_tr_2d = np.asarray(y_tr).reshape(len(y_tr), -1)
+    y_te_2d = np.asarray(y_te).reshape(len(y_te), -1)
+    multi_output = np.ndim(y_tr) > 1
+
+    def predict(models, X):
+        prediction = np.column_stack([m.predict(X) for m in models])
+        return prediction if multi_output else prediction[:, 0]
+
+    train_scores = []
+    test_scores = []
+    models = []
+    for d in depths:
+        fitted = [
+            Model(max_depth=d, **params).fit(X_tr, y_tr_2d[:, i])
+            for i in range(y_tr_2d.shape[1])
+        ]
+        models.append(fitted if multi_output else fitted[0])
+
+        if logistic:
+            # use AUC scoring
+            train_scores.append(roc_auc_score(y_tr, predict(fitted, X_tr)))
+            test_scores.append(roc_auc_score(y_te, predict(fitted, X_te)))
+        else:
+            # use R2 scoring
+            train_scores.append(
+                np.mean([m.score(X_tr, y_tr_2d[:, i])
+                         for i, m in enumerate(fitted)])
+            )
+            test_scores.append(
+                np.mean([m.score(X_te, y_te_2d[:, i])
+                         for i, m in enumerate(fitted)])
+            )
+
+    cvmeans = np.full(len(depths), np.nan)
+    cvstds = np.full(len(depths), np.nan)
+
+    return (
+        cvmeans, cvstds, np.array(train_scores), np.array(test_scores),
+        models
+    )
+
+
 def define_train_and_test(data_train, data_test, attributes,
                           response, logistic) -> (pd.DataFrame, pd.DataFrame):
     """Return x and y data for train and test sets
+
+    data_train can also be a shared_data.SharedDataset, in which case the
+    data is read from shared memory and data_test is ignored
     """
+    if isinstance(data_train, SharedDataset):
+        X_tr, X_te, y_tr, y_te = data_train.train_and_test(
+            attributes, logistic=logistic
+        )
+        return X_tr, X_te, y_tr[response], y_te[response]
+
     X_tr = data_train[attributes]
     y_tr = data_train[response]
 
@@ -272,7 +658,6 @@ def plot_me(result):
     
     relies on 'result' dictionary from 'calculate' function
     """    
-    depths = list(range(1, 21))
     cv = 5
     
     responses = result.get('responses')
@@ -282,7 +667,7 @@ def plot_me(result):
     model_type = result.get('model_type')
     train_scores = result.get('train_scores')
     test_scores = result.get('test_scores')
-    x = result.get('depths')
+    x = list(result.get('depths'))
     
     print(f"Model Optmized for: {result.get('responses')}")
     
@@ -291,7 +676,7 @@ def plot_me(result):
     for i, (a, response) in enumerate(zip(np.ravel(ax), responses)):
 
         best_depth = result.get('best_depth')
-        best_score = test_scores[best_depth-1]
+        best_score = test_scores[x.index(best_depth)]
 
         a.set_xlabel("Maximum Tree Depth")
 
@@ -303,7 +688,7 @@ def plot_me(result):
             fontsize=10
         )
         a.set_ylabel(f"{score_type.capitalize()} Score")
-        a.set_xticks(depths)
+        a.set_xticks(x)
 
         # Plot model train scores
         a.plot(
@@ -322,9 +707,32 @@ def plot_me(result):
             
 
 def calculate(data_train, data_test, categories, attributes:list, 
-              responses_list:list, logistic=True):
+              responses_list:list, logistic=True, bins=None,
+              model_family='tree'):
     """returns the results of using a set of attributes on the data
+
+    If bins (a histtree.FeatureBins of the same data) is given, the depth
+    sweep uses histogram trees on the pre-binned attributes, so
+    'best_depth' and the 'train_scores' and 'test_scores' of each depth are
+    those of the histogram trees, which can differ from sklearn trees in how
+    they break ties between splits and, for attributes with more than 256
+    distinct values, in the thresholds available. 'best_model' and the
+    model_dict are sklearn trees of that depth refit on the unbinned data,
+    and 'train_score' and 'test_score' are the scores of best_model itself.
+    The histogram tree of the best depth is added under 'hist_model'
+
+    With model_family='hist_gb', histogram gradient boosting models of each
+    of the hgb_depths are fit instead of single trees (see
+    calc_hist_gradient_boosting()), with the category dummies collapsed into
+    one native categorical feature where sklearn supports it, and the
+    results have the same keys
     """
+    if model_family not in ['tree', 'hist_gb']:
+        raise ValueError(
+            "model_family only accepts 'tree' or 'hist_gb', but you have "\
+            "entered: {}".format(model_family)
+        )
+
     if logistic:
         model_type = 'Logistic'
         score_type = 'auc'
@@ -355,15 +763,62 @@ def calculate(data_train, data_test, categories, attributes:list,
             ['Budget_Change_Ratio', 'Schedule_Change_Ratio'], logistic=logistic
         )
         
-        cvmeans, cvstds, train_scores, test_scores, models = calc(
-            X_tr, y_tr[response], X_te, y_te[response]
-        )
+        if model_family=='hist_gb':
+            X_tr, X_te, categorical_features = _collapse_categories(
+                X_tr, X_te, categories
+            )
+            sweep_depths = hgb_depths
+            cvmeans, cvstds, train_scores, test_scores, models = \
+                calc_hist_gradient_boosting(
+                    X_tr, y_tr[response], X_te, y_te[response],
+                    depths=sweep_depths, logistic=logistic,
+                    categorical_features=categorical_features
+                )
+        elif bins is None:
+            sweep_depths = depths
+            cvmeans, cvstds, train_scores, test_scores, models = calc(
+                X_tr, y_tr[response], X_te, y_te[response]
+            )
+        else:
+            sweep_depths = depths
+            Xb_tr, Xb_te = bins.get(attrs)
+            cvmeans, cvstds, train_scores, test_scores, models = calc(
+                Xb_tr, y_tr[response], Xb_te, y_te[response], histogram=True
+            )
 
-        best_model = models[test_scores.argmax()]
-        best_score = test_scores[test_scores.argmax()]
-        best_depth = test_scores.argmax()+1
+        best_index = test_scores.argmax()
+        best_model = models[best_index]
+        best_score = test_scores[best_index]
+        best_depth = sweep_depths[best_index]
+
+        train_score = train_scores[best_index]
+        test_score = test_scores[best_index]
+
+        hist_model = None
+        if model_family=='tree' and bins is not None:
+            # keep returning a sklearn tree, refit on the unbinned data at
+            # the depth chosen by the histogram sweep, and report its scores
+            hist_model = best_model
+            best_model = (
+                DecisionTreeClassifier if logistic else DecisionTreeRegressor
+            )(max_depth=best_depth, random_state=109).fit(
+                X_tr, y_tr[response]
+            )
+            if logistic:
+                train_score = roc_auc_score(
+                    y_tr[response], best_model.predict(X_tr)
+                )
+                test_score = roc_auc_score(
+                    y_te[response], best_model.predict(X_te)
+                )
+            else:
+                train_score = best_model.score(X_tr, y_tr[response])
+                test_score = best_model.score(X_te, y_te[response])
         
-        desc = f"{model_type} Tree. Depth: {best_depth}"
+        if model_family=='hist_gb':
+            desc = f"{model_type} Hist Gradient Boosting. Depth: {best_depth}"
+        else:
+            desc = f"{model_type} Tree. Depth: {best_depth}"
 
         results.append(
             {
@@ -377,15 +832,40 @@ def calculate(data_train, data_test, categories, attributes:list,
                 'Budget_and_Schedule_Change': 1 if len(response) == 2 else 0,
                 'scoring': score_type,
                 'best_depth':best_depth,
-                'train_score':train_scores[best_depth-1],
+                'train_score':train_score,
                 'train_scores':train_scores,
-                'test_score':test_scores[best_depth-1],
+                'test_score':test_score,
                 'test_scores':test_scores,
                 'best_model':best_model,
-                'depths':depths
+                'depths':sweep_depths
             }
         )
+        if hist_model is not None:
+            results[-1]['hist_model'] = hist_model
         
+        if model_family=='hist_gb':
+            model_params = dict(hgb_params, max_depth=best_depth)
+            if categorical_features is not None:
+                model_params['categorical_features'] = categorical_features
+            model_dict.append(
+                generate_model_dict(
+                    model=HistGradientBoostingClassifier if logistic \
+                        else HistGradientBoostingRegressor,
+                    model_descr=desc, 
+                    X_train=X_tr, 
+                    X_test=X_te, 
+                    y_train=y_tr, 
+                    y_test=y_te, 
+                    multioutput=False,
+                    verbose=False,
+                    predictions=True,
+                    scores=True,
+                    model_api='sklearn',
+                    sm_formulas=None,
+                    y_stored=True,
+                    **model_params))
+            continue
+
         model_dict.append(
             generate_model_dict(
                 model=DecisionTreeClassifier if logistic else DecisionTreeRegressor, 
@@ -409,11 +889,24 @@ def calculate(data_train, data_test, categories, attributes:list,
 
 def calc_models(data_train, data_test, categories, 
                 nondescr_attrbutes, descr_attributes,
-                responses_list, logistic=True):
+                responses_list, logistic=True, histogram=False,
+                model_family='tree'):
     """iterates over all combinations of attributes to return lists of resulting models
+
+    With histogram=True every attribute is binned to uint8 once, and the
+    depth sweeps use histogram trees on the pre-binned columns. With
+    model_family='hist_gb' histogram gradient boosting models are fit
+    instead (see calculate())
     """
     results_all = []
     model_dicts = []
+
+    bins = None
+    if histogram:
+        if isinstance(data_train, SharedDataset):
+            bins = FeatureBins(*data_train.train_and_test(data_train.columns)[:2])
+        else:
+            bins = FeatureBins(data_train, data_test)
     
     print(f"Using {'LOGISTIC' if logistic else 'REGRESSION'} models")
     for i in tqdm(range(1, len(nondescr_attrbutes))):
@@ -422,14 +915,16 @@ def calc_models(data_train, data_test, categories,
             a = list(a)
             results, model_dict = calculate(
                 data_train, data_test, categories, attributes=a, 
-                responses_list=responses_list, logistic=logistic
+                responses_list=responses_list, logistic=logistic, bins=bins,
+                model_family=model_family
             )
             results_all += results
             model_dicts += model_dict
             for d_emb in tqdm(descr_attributes, leave=False):
                 results, model_dict = calculate(
                     data_train, data_test, categories, attributes=a + [d_emb],
-                    responses_list=responses_list, logistic=logistic
+                    responses_list=responses_list, logistic=logistic,
+                    bins=bins, model_family=model_family
                 )
                 results_all += results
                 model_dicts += model_dict
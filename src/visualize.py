@@ -50,13 +50,15 @@ FUNCTIONS
         
 """
 
-from PIL import Image
-
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
-from sklearn.metrics import r2_score
+from .lazy import lazy_import
+
+Image = lazy_import('PIL.Image')
+plt = lazy_import('matplotlib.pyplot')
+
+r2_score = lazy_import('sklearn.metrics', 'r2_score')
 
 
 def plot_value_counts(value_counts, var_name, figsize=(9, 3),
@@ -0,0 +1,24 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import numpy as np
+import scipy.sparse
+
+from src.cluster import fit_minibatch_kmeans, silplot
+
+
+def test_silplot_sparse_minibatch_kmeans():
+    rng = np.random.default_rng(109)
+    categories = rng.integers(0, 20, size=(3000, 3))
+    rows = np.repeat(np.arange(3000), 3)
+    cols = (categories + np.arange(3) * 20).ravel()
+    X = scipy.sparse.csr_matrix(
+        (np.ones(rows.size), (rows, cols)), shape=(3000, 60)
+    )
+
+    model = fit_minibatch_kmeans(X, n_clusters=4, batch_size=500)
+    labels = model.predict(X)
+
+    silplot(X, labels, model, sample_size=500)
+    assert len(plt.gcf().axes) == 2